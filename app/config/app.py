@@ -4,7 +4,7 @@ from app.config.enums import Environment
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
-from app.config.enums import Milestone
+from app.config.enums import EmbeddingStorage, GraphBackend, Milestone
 from typing import Optional
 
 
@@ -21,5 +21,26 @@ class Config(BaseSettings):
     milestone: Milestone = Milestone.THREE
     environment: Environment = Environment.DEV if "dev" in sys.argv or "--reload" in sys.argv else Environment.PROD
     use_llm: bool = False
+    background_loading: bool = True  # load graph, embeddings and image metadata on a background thread
+    graph_backend: GraphBackend = GraphBackend.INDEXED
+    use_graph_snapshot: bool = True  # compile the RDF graph into a binary snapshot and memory-map it on later starts
+    full_graph: bool = False  # keep all predicates and languages instead of only what the bot queries
+    shared_store: bool = False  # memory-map graph indexes and embeddings read-only so uvicorn workers share one copy
+    graph_ingestion_workers: int = os.cpu_count() or 1  # processes parsing the N-Triples file, 1 uses rdflib's parser
+    prepared_query_cache_size: int = 256
+    query_result_cache_size: int = 1024  # 0 disables the query result cache
+    query_result_cache_bytes: int = 32 * 1024 * 1024
+    query_result_cache_ttl: float = 3600  # seconds
+    slow_query_threshold_ms: float = 500
+    query_metrics_max_templates: int = 256  # further query templates are counted under "other"
+    embeddings_storage: EmbeddingStorage = EmbeddingStorage.FLOAT32  # float16 and int8 copies are converted once
+    mmap_embeddings: bool = False  # memory-map the embedding matrices read-only instead of reading them into RAM
+    embeddings_type_filter: bool = True  # only predict entities whose type occurs as object type of the relation
+    # answer embedding questions from an IVF index instead of scanning all entities, approximate answers may differ;
+    # check the recall with utils/benchmarks/embedding_ann.py on the entity embeddings before enabling it
+    embeddings_ann: bool = False
+    ann_lists: int = 0  # k-means lists of the IVF index, 0 uses the square root of the number of entities
+    ann_probe: int = 16  # lists scanned per query, more is slower but has a higher recall
+    extraction_cache_size: int = 1024  # extracted names per (message, entity type), 0 disables the cache
 
 settings = Config()
@@ -9,3 +9,17 @@ class Milestone(enum.Enum):
     TWO: str = "Milestone 2"
     THREE: str = "Milestone 3"
     FINAL: str = "Final Project"
+
+class ReadinessState(enum.Enum):
+    LOADING: str = "loading"
+    READY: str = "ready"
+    ON_DEMAND: str = "on demand"  # not loaded yet, the first request using it loads it
+
+class GraphBackend(enum.Enum):
+    RDFLIB: str = "rdflib"
+    INDEXED: str = "indexed"
+
+class EmbeddingStorage(enum.Enum):
+    FLOAT32: str = "float32"
+    FLOAT16: str = "float16"
+    INT8: str = "int8"
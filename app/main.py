@@ -4,10 +4,11 @@ import time
 from typing import List
 
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from speakeasypy import Chatroom, Speakeasy  # installed as wheel
 
 from app.config.app import settings
-from app.config.enums import Environment
+from app.config.enums import Environment, ReadinessState
 from app.services.agent_answering_service import AgentAnsweringService
 
 
@@ -26,6 +27,7 @@ setup_logging()
 logger = logging.getLogger(__name__)
 
 app = FastAPI()
+answering_service: AgentAnsweringService | None = None
 
 
 class Agent:
@@ -103,6 +105,20 @@ def read_root():
     return {"message": "Welcome to the Chatbot!"}
 
 
+@app.get("/health")
+def health():
+    if answering_service is None:
+        return {"status": ReadinessState.LOADING.value}
+    return answering_service.get_readiness()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    if answering_service is None:
+        return ""
+    return answering_service.get_metrics()
+
+
 @app.get("/{message}")
 def read_root(message: str):
     return answering_service.get_answer_for_message(message)
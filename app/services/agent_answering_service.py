@@ -1,8 +1,11 @@
 import logging
+import threading
+from datetime import datetime
+
 import numpy as np
 
 from app.config.app import settings
-from app.config.enums import Environment, Milestone
+from app.config.enums import Environment, Milestone, ReadinessState
 from app.services.crowd_service import CrowdService
 from app.services.disambiguation_service import DisambiguationService
 from app.services.embeddings_service import EmbeddingsService
@@ -16,14 +19,18 @@ from app.services.sparql_graph import SPARQLGraph
 
 logger = logging.getLogger(__name__)
 
+LOADING_REPLY = "I am still loading my knowledge graph and images. Please ask again in a moment."
+
 
 class AgentAnsweringService:
     def __init__(self, environment: Environment = settings.environment):
         print("Initializing AgentAnsweringService with environment: ", environment)
-        lazy_load = environment != Environment.PROD
+        lazy_load = settings.background_loading or environment != Environment.PROD
         sparql_graph = SPARQLGraph(environment, lazy_load)
-        embeddings = EmbeddingsService(lazy_load)
+        embeddings = EmbeddingsService(lazy_load, sparql_graph)
         crowd = CrowdService()
+        self._sparql_graph = sparql_graph
+        self._embeddings = embeddings
 
         self.disambiguation = DisambiguationService()
         self.message_received_templates = [
@@ -60,16 +67,54 @@ class AgentAnsweringService:
             raise NotImplementedError("Milestone 2 not supported anymore")
             # answering_service = EmbeddingAndKnowledgeAnswerService(sparql_graph, embeddings)
         elif settings.milestone == Milestone.THREE:
-            spacy_extractor = SpacyExtractor()
+            spacy_extractor = SpacyExtractor(sparql_graph)
             print("Spacy extractor initialized")
             self.knowledge_answering_service = EmbeddingAndKnowledgeAnswerService(sparql_graph, embeddings, crowd, self.disambiguation, spacy_extractor)
-            self.image_finder = ImageFinder(sparql_graph, self.disambiguation, spacy_extractor)
+            self.image_finder = ImageFinder(sparql_graph, self.disambiguation, spacy_extractor, lazy_load)
             self.recommendation_service = RecommendationService(sparql_graph, spacy_extractor, self.image_finder, self.disambiguation)
         else:  # Final Project
             raise NotImplementedError("Final Project not implemented yet")
 
         self.question_classifier = QuestionClassifier()
 
+        # without background loading, every resource is loaded by the first request using it
+        if settings.background_loading:
+            for resource in self._resources():
+                resource.load_in_background()
+            threading.Thread(target=self._load_resources, name="resource-loader", daemon=True).start()
+
+    def _resources(self) -> dict:
+        return {"graph": self._sparql_graph, "embeddings": self._embeddings, "images": self.image_finder}
+
+    def _is_loading(self) -> bool:
+        """Check whether any resource is still loaded in the background, using it now would block."""
+        return any(resource.is_loading_in_background() for resource in self._resources().values())
+
+    def _load_resources(self):
+        """Load the graph, the embeddings and the image metadata without blocking the startup."""
+        start = datetime.now()
+        for resource in self._resources().values():
+            try:
+                resource.ensure_loaded()
+            except Exception as e:
+                print(f"Failed to load {type(resource).__name__}: {e}")
+        print(f"All resources loaded in the background after {datetime.now() - start}")
+
+    def get_readiness(self) -> dict[str, str]:
+        """Get the state of each resource, the bot is ready once no resource is still loaded in the background."""
+        def state(resource) -> ReadinessState:
+            if resource.is_ready():
+                return ReadinessState.READY
+            return ReadinessState.LOADING if resource.is_loading_in_background() else ReadinessState.ON_DEMAND
+
+        states = {name: state(resource) for name, resource in self._resources().items()}
+        status = ReadinessState.LOADING if ReadinessState.LOADING in states.values() else ReadinessState.READY
+        return {"status": status.value, **{name: state.value for name, state in states.items()}}
+
+    def get_metrics(self) -> str:
+        """Get the SPARQL query metrics in the Prometheus text format."""
+        return self._sparql_graph.render_metrics()
+
     def disambiguation_required(self, room_id: str) -> bool:
         return self.disambiguation.disambiguation_required(room_id)
 
@@ -113,6 +158,8 @@ class AgentAnsweringService:
 
         elif question_type == QuestionCategory.KNOWLEDGE:
             return self.knowledge_answering_service.get_response(room_id, message)
+        elif question_type in (QuestionCategory.MULTIMEDIA, QuestionCategory.RECOMMENDATION) and self._is_loading():
+            return LOADING_REPLY
         elif question_type == QuestionCategory.MULTIMEDIA:
             return self.image_finder.get_response(room_id, message)
         elif question_type == QuestionCategory.RECOMMENDATION:
@@ -133,6 +180,10 @@ class AgentAnsweringService:
             self.disambiguation.clear_ambiguities(room_id)
             return "Okay, on your demand the process has been interrupted. I\'m happy to answer any other questions :)"
         ambiguity = self.disambiguation.get_ambiguity(room_id)
+        # keep the ambiguity until the resources are loaded, answering it now would block on the background load
+        if ambiguity["question_type"] in (QuestionCategory.MULTIMEDIA, QuestionCategory.RECOMMENDATION) and \
+                self._is_loading():
+            return LOADING_REPLY
         self.disambiguation.remove_ambiguity(room_id)
         if ambiguity["question_type"] == QuestionCategory.KNOWLEDGE:
             return self.knowledge_answering_service.get_answer_and_make_response(
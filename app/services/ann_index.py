@@ -0,0 +1,101 @@
+import numpy as np
+
+from app.services.graph_snapshot import read_arrays, read_meta, write_arrays
+
+
+class IVFFlatIndex:
+    """
+    Inverted file index for approximate nearest neighbour search by euclidean distance.
+
+    The vectors are clustered with k-means and every vector is filed under its nearest centroid. A query only scans
+    the vectors of the `n_probe` lists whose centroids are closest to it, the distances within those lists are exact.
+    The index stores only row ids and squared norms, the vectors themselves stay in the matrix the index was built from.
+    """
+    VERSION = 1
+
+    def __init__(self, vectors: np.ndarray, norms: np.ndarray, centroids: np.ndarray, list_offsets: np.ndarray,
+                 list_ids: np.ndarray, n_probe: int = 8):
+        self.vectors = vectors
+        self.norms = norms  # squared euclidean norm of every vector
+        self.centroids = centroids
+        self.list_offsets = list_offsets  # list_ids[list_offsets[i]:list_offsets[i + 1]] are the rows in list i
+        self.list_ids = list_ids
+        self.n_probe = n_probe
+        self._centroid_norms = np.einsum("ij,ij->i", centroids, centroids)
+
+    def __len__(self) -> int:
+        return len(self.list_ids)
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, n_lists: int | None = None, n_probe: int = 8, iterations: int = 10,
+              sample_size: int = 65536, seed: int = 0) -> "IVFFlatIndex":
+        """Train the centroids with k-means on a sample of the vectors and assign every vector to its nearest one."""
+        rng = np.random.default_rng(seed)
+        n_lists = min(n_lists or max(1, int(np.sqrt(len(vectors)))), len(vectors))
+        sample = np.asarray(vectors[rng.choice(len(vectors), min(sample_size, len(vectors)), replace=False)],
+                            dtype=np.float32)
+
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = _nearest(sample, centroids)
+            counts = np.bincount(assignment, minlength=n_lists)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+            # lists that lost all their vectors are reseeded with random sample vectors
+            centroids[~filled] = sample[rng.choice(len(sample), int((~filled).sum()), replace=False)]
+
+        assignment = np.concatenate([_nearest(np.asarray(vectors[start:start + sample_size], dtype=np.float32),
+                                              centroids) for start in range(0, len(vectors), sample_size)])
+        list_ids = np.argsort(assignment, kind="stable").astype(np.int32)
+        list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=n_lists), out=list_offsets[1:])
+        norms = np.concatenate([np.einsum("ij,ij->i", chunk, chunk) for chunk in
+                                (np.asarray(vectors[start:start + sample_size], dtype=np.float32)
+                                 for start in range(0, len(vectors), sample_size))])
+        return cls(vectors, norms, centroids, list_offsets, list_ids, n_probe)
+
+    def search(self, query: np.ndarray, k: int = 1, n_probe: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Get the row ids of the approximately k nearest vectors to a query and their distances, nearest first."""
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+
+        centroid_distances = self._centroid_norms - 2 * (self.centroids @ query)
+        lists = np.argpartition(centroid_distances, n_probe - 1)[:n_probe]
+        candidates = np.concatenate([self.list_ids[self.list_offsets[i]:self.list_offsets[i + 1]] for i in lists])
+        if not len(candidates):
+            return candidates, np.empty(0, dtype=np.float32)
+
+        # gathering the rows in ascending order touches the (possibly memory-mapped) matrix sequentially
+        candidates = np.sort(candidates)
+        # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2, a matrix-vector product is much cheaper than the differences
+        distances = self.norms[candidates] - 2 * (np.asarray(self.vectors[candidates], dtype=np.float32) @ query)
+        distances = np.maximum(distances + query @ query, 0)
+        k = min(k, len(candidates))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        return candidates[top], np.sqrt(distances[top])
+
+    def save(self, directory: str, source_checksum: str):
+        write_arrays(directory, {"norms": self.norms, "centroids": self.centroids, "list_offsets": self.list_offsets,
+                                 "list_ids": self.list_ids},
+                     {"version": self.VERSION, "source_checksum": source_checksum, "vectors": len(self.list_ids)})
+
+    @classmethod
+    def load(cls, directory: str, vectors: np.ndarray, source_checksum: str, n_probe: int = 8,
+             mmap_mode: str | None = None) -> "IVFFlatIndex | None":
+        """Load a saved index for the given vectors, None if it is missing or was built from other vectors."""
+        meta = read_meta(directory, cls.VERSION, source_checksum)
+        if meta is None or meta.get("vectors") != len(vectors):
+            return None
+        arrays = read_arrays(directory, ["norms", "list_offsets", "list_ids"], mmap_mode)
+        centroids = read_arrays(directory, ["centroids"], None)["centroids"]
+        return cls(vectors, arrays["norms"], centroids, arrays["list_offsets"], arrays["list_ids"], n_probe)
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Get the index of the nearest centroid of every vector."""
+    # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2, where ||x||^2 does not change the nearest centroid
+    distances = np.einsum("ij,ij->i", centroids, centroids) - 2 * (vectors @ centroids.T)
+    return np.argmin(distances, axis=1)
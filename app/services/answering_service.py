@@ -20,4 +20,7 @@ class SPARQLAnswerService(AnsweringService):
 
     def get_response(self, query: str, room_id: str = "") -> str:
         """Use the SPARQLGraph to execute a query and return the response."""
+        # querying while the graph is loaded in the background would block the caller until the load is done
+        if self.sparql_graph.is_loading_in_background():
+            return "I am still loading my knowledge graph. Please ask again in a moment."
         return self.sparql_graph.execute_query(query)
@@ -0,0 +1,52 @@
+import numpy as np
+
+
+class CompletionTable:
+    """
+    Precomputed top-k TransE predictions for (entity, relation) embedding id pairs.
+
+    The pairs are packed into sorted int64 keys `entity << 32 | relation`, row i of `predictions` holds the entity ids
+    predicted for key i, most plausible first.
+    """
+    VERSION = 1
+
+    def __init__(self, keys: np.ndarray, predictions: np.ndarray):
+        self.keys = keys
+        self.predictions = predictions
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @staticmethod
+    def pack(entities: np.ndarray, relations: np.ndarray) -> np.ndarray:
+        return np.asarray(entities, dtype=np.int64) << 32 | np.asarray(relations, dtype=np.int64)
+
+    @classmethod
+    def from_predictions(cls, entities: np.ndarray, relations: np.ndarray, predictions: np.ndarray) -> "CompletionTable":
+        keys = cls.pack(entities, relations)
+        order = np.argsort(keys, kind="stable")
+        return cls(keys[order], np.asarray(predictions, dtype=np.int32)[order])
+
+    def get(self, entity: int, relation: int) -> np.ndarray | None:
+        """Get the predicted entity ids of a pair, None if the pair was not precomputed."""
+        key = int(self.pack(entity, relation))
+        position = int(np.searchsorted(self.keys, key))
+        if position == len(self.keys) or self.keys[position] != key:
+            return None
+        return self.predictions[position]
+
+    def save(self, path: str, source_checksum: str):
+        np.savez(path, keys=self.keys, predictions=self.predictions,
+                 meta=np.array([str(self.VERSION), source_checksum]))
+
+    @classmethod
+    def load(cls, path: str, source_checksum: str) -> "CompletionTable | None":
+        """Load a saved table, None if it is missing or was computed from other embeddings."""
+        try:
+            with np.load(path) as data:
+                version, checksum = data["meta"].tolist()
+                if version != str(cls.VERSION) or checksum != source_checksum:
+                    return None
+                return cls(data["keys"], data["predictions"])
+        except FileNotFoundError:
+            return None
@@ -0,0 +1,144 @@
+import numpy as np
+
+from app.config.enums import EmbeddingStorage
+from app.services.graph_snapshot import read_arrays, read_meta, write_arrays
+
+
+class EmbeddingMatrix:
+    """
+    Row-major embedding matrix stored as float32, float16 or int8 with one float32 scale per row.
+
+    Indexing returns dequantized float32 rows, distances are computed chunk by chunk directly on the stored values,
+    so the full float32 matrix is never materialized for the compact formats.
+    """
+    VERSION = 1
+
+    def __init__(self, values: np.ndarray, scales: np.ndarray | None = None, norms: np.ndarray | None = None):
+        self.values = values
+        self.scales = scales  # row i is values[i] * scales[i], only for int8 values
+        self.norms = self._squared_norms() if norms is None else norms
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.values.shape
+
+    @property
+    def storage(self) -> EmbeddingStorage:
+        return EmbeddingStorage(self.values.dtype.name)
+
+    def __getitem__(self, rows) -> np.ndarray:
+        values = np.asarray(self.values[rows], dtype=np.float32)
+        if self.scales is None:
+            return values
+        scales = self.scales[rows]
+        return values * (scales[..., None] if np.ndim(scales) else scales)
+
+    @classmethod
+    def from_float(cls, matrix: np.ndarray, storage: EmbeddingStorage, chunk_size: int = 65536) -> "EmbeddingMatrix":
+        """Convert a matrix of any float type to the given storage format."""
+        if matrix.dtype.kind != "f":
+            raise ValueError(f"Embeddings must be floats, got {matrix.dtype}")
+        if storage == EmbeddingStorage.FLOAT32:
+            return cls(np.asarray(matrix, dtype=np.float32))
+        if storage == EmbeddingStorage.FLOAT16:
+            return cls(np.asarray(matrix, dtype=np.float16))
+
+        values = np.empty(matrix.shape, dtype=np.int8)
+        scales = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), chunk_size):
+            chunk = np.asarray(matrix[start:start + chunk_size], dtype=np.float32)
+            # symmetric quantization, the largest absolute value of every row is mapped to 127
+            chunk_scales = np.abs(chunk).max(axis=1) / 127
+            chunk_scales[chunk_scales == 0] = 1
+            values[start:start + chunk_size] = np.rint(chunk / chunk_scales[:, None])
+            scales[start:start + chunk_size] = chunk_scales
+        return cls(values, scales)
+
+    def _squared_norms(self, chunk_size: int = 65536) -> np.ndarray:
+        norms = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), chunk_size):
+            chunk = self[start:start + chunk_size]
+            norms[start:start + chunk_size] = np.einsum("ij,ij->i", chunk, chunk)
+        return norms
+
+    def distances(self, lhs: np.ndarray, rows: np.ndarray | None = None, chunk_size: int = 4096) -> np.ndarray:
+        """Compute the euclidean distances of a vector to all rows, or only to the given rows."""
+        # small chunks keep the dequantized float32 block in the CPU cache
+        lhs = np.asarray(lhs, dtype=np.float32).reshape(-1)
+        count = len(self) if rows is None else len(rows)
+        squared = np.empty(count, dtype=np.float32)
+        for start in range(0, count, chunk_size):
+            chunk = slice(start, min(start + chunk_size, count))
+            selected = chunk if rows is None else rows[chunk]
+            # ||x - l||^2 = ||x||^2 - 2 x.l + ||l||^2, where x.l of an int8 row is (q.l) * scale
+            dots = np.asarray(self.values[selected], dtype=np.float32) @ lhs
+            if self.scales is not None:
+                dots *= self.scales[selected]
+            squared[chunk] = self.norms[selected] - 2 * dots
+        return np.sqrt(np.maximum(squared + lhs @ lhs, 0))
+
+    def nearest(self, lhs: np.ndarray, k: int = 1, chunk_size: int = 16384,
+                query_chunk_size: int = 256) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k nearest rows of every query vector with chunked matrix products.
+
+        Returns the (queries, k) arrays of row ids and distances, nearest first. Memory stays bounded by
+        `query_chunk_size * chunk_size` distances, only the running top-k of every query is kept between chunks.
+        """
+        lhs = np.asarray(lhs, dtype=np.float32).reshape(-1, self.shape[1])
+        k = min(k, len(self))
+        ids = np.empty((len(lhs), k), dtype=np.int64)
+        distances = np.empty((len(lhs), k), dtype=np.float32)
+        for query_start in range(0, len(lhs), query_chunk_size):
+            queries = lhs[query_start:query_start + query_chunk_size]
+            query_norms = np.einsum("ij,ij->i", queries, queries)[:, None]
+            best_ids = np.empty((len(queries), 0), dtype=np.int64)
+            best = np.empty((len(queries), 0), dtype=np.float32)
+            for start in range(0, len(self), chunk_size):
+                chunk = slice(start, min(start + chunk_size, len(self)))
+                dots = queries @ np.asarray(self.values[chunk], dtype=np.float32).T
+                if self.scales is not None:
+                    dots *= self.scales[chunk]
+                # merge the running top-k with the candidates of this chunk and keep the k best of both
+                candidates = np.concatenate([best, self.norms[chunk] - 2 * dots + query_norms], axis=1)
+                candidate_ids = np.concatenate(
+                    [best_ids, np.broadcast_to(np.arange(chunk.start, chunk.stop), dots.shape)], axis=1)
+                top = np.argpartition(candidates, k - 1, axis=1)[:, :k]
+                best = np.take_along_axis(candidates, top, axis=1)
+                best_ids = np.take_along_axis(candidate_ids, top, axis=1)
+
+            order = np.argsort(best, axis=1)
+            rows = slice(query_start, query_start + len(queries))
+            ids[rows] = np.take_along_axis(best_ids, order, axis=1)
+            distances[rows] = np.sqrt(np.maximum(np.take_along_axis(best, order, axis=1), 0))
+        return ids, distances
+
+    def save(self, directory: str, source_checksum: str, values: bool = True):
+        """Write the matrix to a directory, only its norms if `values` is False because the source is used as is."""
+        arrays = {"norms": self.norms}
+        if values:
+            arrays["values"] = self.values
+        if self.scales is not None:
+            arrays["scales"] = self.scales
+        write_arrays(directory, arrays, {"version": self.VERSION, "source_checksum": source_checksum,
+                                         "storage": self.storage.value})
+
+    @classmethod
+    def load(cls, directory: str, source_checksum: str, mmap_mode: str | None = None,
+             values: np.ndarray | None = None) -> "EmbeddingMatrix | None":
+        """
+        Load a converted matrix, None if it is missing or was converted from another source file.
+
+        If `values` is given, only the norms (and scales) saved for them are read from the directory.
+        """
+        meta = read_meta(directory, cls.VERSION, source_checksum)
+        if meta is None:
+            return None
+        names = ["norms"] + (["values"] if values is None else [])
+        if meta.get("storage") == EmbeddingStorage.INT8.value:
+            names.append("scales")
+        arrays = read_arrays(directory, names, mmap_mode)
+        return cls(arrays["values"] if values is None else values, arrays.get("scales"), arrays["norms"])
@@ -1,113 +1,299 @@
-import csv
 import os
+import threading
 from datetime import datetime
 
 import numpy as np
-import rdflib
-from rdflib import URIRef
-from sklearn.metrics import pairwise_distances
 
 from app.config.app import settings
+from app.config.enums import EmbeddingStorage
+from app.services.ann_index import IVFFlatIndex
+from app.services.completion_table import CompletionTable
+from app.services.embedding_matrix import EmbeddingMatrix
+from app.services.graph_snapshot import file_checksum, file_signature, load_or_build
+from app.services.id_mapping import IdMapping
+from app.services.sparql_graph import SPARQLGraph, WD, WDT
 
 
 class EmbeddingsService:
-    def __init__(self, lazy_load=False):
-        self.entity_emb: np.ndarray | None = None
+    # candidates taken from the entity index before filtering them by the types of a relation
+    FILTERED_SEARCH_K = 64
+
+    def __init__(self, lazy_load=False, sparql_graph: SPARQLGraph | None = None):
+        self._sparql_graph = sparql_graph
+        self.entity_emb: EmbeddingMatrix | None = None
         self.relation_emb: np.ndarray | None = None
-        self.ent2id = {}
-        self.rel2id = {}
-        self.id2ent = {}
-        self.id2rel = {}
+        self.entity_ids: IdMapping | None = None
+        self.relation_ids: IdMapping | None = None
+        self.entity_index: IVFFlatIndex | None = None
+        self.completions: CompletionTable | None = None
+        self._candidates: dict[str, np.ndarray] = {}  # relation -> sorted entity rows of its range types
+        self._load_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._background_load = False  # set when a loader thread owns the load
 
         # Load metadata from DEL files
         self._load_metadata()
+        if settings.embeddings_type_filter and sparql_graph is not None:
+            # built with every graph load, before the graph reports ready
+            sparql_graph.add_load_hook(self._build_candidates)
 
         # Load embeddings if not lazy loading
         if not lazy_load:
-            self._load_embeddings()
+            self.ensure_loaded()
+
+    def ensure_loaded(self):
+        """Lazy-load the embeddings if they weren't loaded initially, blocking until they are available."""
+        if self._ready.is_set():
+            return
+        with self._load_lock:
+            if not self._ready.is_set():
+                self._load_embeddings()
+                self._ready.set()
+
+    def is_ready(self) -> bool:
+        """Check whether the embeddings are loaded and can be used without blocking."""
+        return self._ready.is_set()
+
+    def load_in_background(self):
+        """Leave the load to a loader thread, requests are answered without the embeddings until they are ready."""
+        self._background_load = True
+
+    def is_loading_in_background(self) -> bool:
+        """Check whether the loader thread has not loaded the embeddings yet, using them now would block."""
+        return self._background_load and not self._ready.is_set()
 
     def _load_embeddings(self):
         """Load embeddings on initialization."""
         start = datetime.now()
         print("Initializing Embeddings")
+        embeddings_path = os.sep.join((settings.utils_path, "too_large_dataset", "ddis-graph-embeddings"))
         try:
-            self.entity_emb = np.load(
-                os.sep.join((settings.utils_path, "too_large_dataset", "ddis-graph-embeddings", "entity_embeds.npy")))
-            self.relation_emb = np.load(
-                os.sep.join((settings.utils_path, "too_large_dataset", "ddis-graph-embeddings", "relation_embeds.npy")))
+            # Memory-mapped matrices are read-only and paged in on demand, all worker processes share the pages
+            mmap_mode = "r" if settings.shared_store or settings.mmap_embeddings else None
+            self.entity_emb = self._load_entity_matrix(os.path.join(embeddings_path, "entity_embeds.npy"), mmap_mode)
+            self.relation_emb = np.load(os.path.join(embeddings_path, "relation_embeds.npy"), mmap_mode=mmap_mode)
 
-            print(f"Embeddings loaded with {len(self.entity_emb)} entries for entities and {len(self.relation_emb)} "
-                  f"entries for relations after {datetime.now() - start}")
+            print(f"Embeddings loaded with {len(self.entity_emb)} entries for entities "
+                  f"({self.entity_emb.storage.value}) and {len(self.relation_emb)} entries for relations after "
+                  f"{datetime.now() - start}")
         except Exception as e:
             print(f"Failed to load NPY data: {e}")
+            return
+
+        if settings.embeddings_ann:
+            self._load_entity_index(os.path.join(embeddings_path, "entity_embeds.npy"))
+
+        # the completions are only valid for the embeddings they were computed from
+        self.completions = CompletionTable.load(self.completions_file(),
+                                                file_signature(os.path.join(embeddings_path, "entity_embeds.npy")))
+        if self.completions is not None:
+            print(f"Precomputed completions loaded for {len(self.completions)} pairs")
+
+    @staticmethod
+    def completions_file() -> str:
+        return os.sep.join((settings.utils_path, "too_large_dataset", "ddis-graph-embeddings", "completions.npz"))
+
+    @staticmethod
+    def _load_entity_matrix(embeddings_file: str, mmap_mode: str | None) -> EmbeddingMatrix:
+        """
+        Load the entity embeddings in the configured storage format, converting them once if necessary.
+
+        A float32 source is used as is and only its norms are saved, any other source is converted to a copy.
+        """
+        matrix = np.load(embeddings_file, mmap_mode=mmap_mode)
+        storage = settings.embeddings_storage
+        in_place = storage == EmbeddingStorage.FLOAT32 and matrix.dtype == np.float32
+        directory = f"{embeddings_file}.{storage.value}"
+        # hashing the whole matrix would cost as much as converting it, size and mtime identify it well enough
+        signature = file_signature(embeddings_file)
+
+        def convert() -> EmbeddingMatrix:
+            if not in_place:
+                print(f"Converting entity embeddings from {matrix.dtype} to {storage.value}")
+            return EmbeddingMatrix.from_float(matrix, storage)
+
+        # only one worker process converts the matrix, the others wait and load the copy
+        return load_or_build(directory,
+                             lambda: EmbeddingMatrix.load(directory, signature, mmap_mode, matrix if in_place else None),
+                             convert, lambda converted: converted.save(directory, signature, values=not in_place))
+
+    def _load_entity_index(self, embeddings_file: str):
+        """Load the IVF index of the entity embeddings, building and saving it next to them if it is missing."""
+        start = datetime.now()
+        index_path = embeddings_file + ".ivf"
+        mmap_mode = "r" if settings.shared_store or settings.mmap_embeddings else None
+        try:
+            # the index stores the norms of the rows it was built from, so it depends on the storage format as well
+            checksum = f"{file_signature(embeddings_file)}-{self.entity_emb.storage.value}"
+            self.entity_index = load_or_build(
+                index_path,
+                lambda: IVFFlatIndex.load(index_path, self.entity_emb, checksum, settings.ann_probe, mmap_mode),
+                lambda: IVFFlatIndex.build(self.entity_emb, settings.ann_lists or None, settings.ann_probe),
+                lambda index: index.save(index_path, checksum))
+            print(f"Entity index loaded with {len(self.entity_index.centroids)} lists after {datetime.now() - start}")
+        except Exception as e:
+            print(f"Failed to load the entity index, falling back to exact search: {e}")
+            self.entity_index = None
 
     def _load_metadata(self):
         """Load metadata from DEL files."""
+        embeddings_path = os.sep.join((settings.utils_path, "too_large_dataset", "ddis-graph-embeddings"))
         try:
-            with open(
-                    os.sep.join((settings.utils_path, "too_large_dataset", "ddis-graph-embeddings", "entity_ids.del")),
-                    'r') as ifile:
-                self.ent2id = {rdflib.term.URIRef(ent): int(idx) for idx, ent in csv.reader(ifile, delimiter='\t')}
-                self.id2ent = {v: k for k, v in self.ent2id.items()}
-            with open(os.sep.join(
-                    (settings.utils_path, "too_large_dataset", "ddis-graph-embeddings", "relation_ids.del"))) as ifile:
-                self.rel2id = {rdflib.term.URIRef(rel): int(idx) for idx, rel in csv.reader(ifile, delimiter='\t')}
-                self.id2rel = {v: k for k, v in self.rel2id.items()}
+            self.entity_ids = self._load_id_mapping(os.path.join(embeddings_path, "entity_ids.del"))
+            self.relation_ids = self._load_id_mapping(os.path.join(embeddings_path, "relation_ids.del"))
 
             print("Metadata loaded successfully from DEL files.")
         except FileNotFoundError as e:
             print(f"Metadata JSON file not found: {e}")
 
+    @staticmethod
+    def _load_id_mapping(del_file: str) -> IdMapping:
+        """Load the compact id mapping of a DEL file, building and saving it next to the file if it is missing."""
+        directory = del_file + ".map"
+        checksum = file_checksum(del_file)
+        mmap_mode = "r" if settings.shared_store or settings.mmap_embeddings else None
+        return load_or_build(directory, lambda: IdMapping.load(directory, checksum, mmap_mode),
+                             lambda: IdMapping.from_del(del_file), lambda mapping: mapping.save(directory, checksum))
+
     def calculate_embeddings(self, entity: str, relation: str) -> str:
         """Calculate the result from embeddings."""
-        WD = rdflib.Namespace('http://www.wikidata.org/entity/')
-        WDT = rdflib.Namespace('http://www.wikidata.org/prop/direct/')
-        DDIS = rdflib.Namespace('http://ddis.ch/atai/')
-        RDFS = rdflib.namespace.RDFS
-        SCHEMA = rdflib.Namespace('http://schema.org/')
-
         try:
-            # Lazy-load the graph if it wasn't loaded initially
-            if self.entity_emb is None or self.relation_emb is None:
-                self._load_embeddings()
+            self.ensure_loaded()
+
+            head_id, pred_id = self._entity_row(WD[entity]), self._relation_row(WDT[relation])
+            candidates = self.get_candidates(relation)
+            precomputed = self.completions.get(head_id, pred_id) if self.completions is not None else None
+            if precomputed is not None:
+                # re-rank the precomputed predictions by keeping only the plausible types
+                most_likely = precomputed if candidates is None else precomputed[np.isin(precomputed, candidates)]
+                if len(most_likely):
+                    return self.get_ent_for_id(int(most_likely[0]))
 
             # Calculate embeddings
-            head = self.entity_emb[self.ent2id[URIRef(WD + entity)]]
-            pred = self.relation_emb[self.rel2id[URIRef(WDT + relation)]]
-            lhs = head + pred  # add vectors according to TransE scoring function.
-            dist = pairwise_distances(lhs.reshape(1, -1), self.entity_emb).reshape(-1)  # compute distance to any entity
-            most_likely = dist.argsort()  # find most plausible entities
+            lhs = self.entity_emb[head_id] + self.relation_emb[pred_id]  # TransE scoring function
+            most_likely = []
+            if self.entity_index is not None:
+                # scan only the entities near lhs, and keep those of a plausible type
+                k = 1 if candidates is None else self.FILTERED_SEARCH_K
+                most_likely, _ = self.entity_index.search(lhs, k=k)
+                if len(most_likely) < k:
+                    most_likely = []  # the probed lists are too small to trust their nearest entities
+                elif candidates is not None:
+                    most_likely = most_likely[np.isin(most_likely, candidates)]
+            if not len(most_likely):
+                most_likely = self.top_k(lhs, 1, candidates)  # find most plausible entities
 
-            result = self.get_ent_for_id(most_likely[0])
+            result = self.get_ent_for_id(int(most_likely[0]))
 
             return result
         except Exception as e:
             print(str(e))
             return "While calculating embeddings, an error occurred."
 
+    def calculate_embeddings_batch(self, pairs: list[tuple[str, str]], k: int = 1) -> list[list[str]]:
+        """
+        Predict the k most plausible entities of many (entity, relation) pairs at once, aligned with the input pairs.
+
+        All `head + pred` vectors are stacked and compared with every entity in one chunked matrix product. Pairs with
+        an unknown entity or relation get no predictions.
+        """
+        self.ensure_loaded()
+        heads = self.get_ids_for_ents([WD[entity] for entity, _ in pairs])
+        preds = np.array([self.get_id_for_rel(WDT[relation]) for _, relation in pairs], dtype=np.int64).reshape(-1)
+        known = np.flatnonzero((heads >= 0) & (preds >= 0))
+        predictions = [[] for _ in pairs]
+        if not len(known):
+            return predictions
+
+        ids = self.predict_ids(heads[known], preds[known], k)
+        for i, top in zip(known.tolist(), ids.tolist()):
+            predictions[i] = [self.get_ent_for_id(_id) for _id in top]
+        return predictions
+
+    def predict_ids(self, heads: np.ndarray, relations: np.ndarray, k: int = 1) -> np.ndarray:
+        """Get the (pairs, k) ids of the entities nearest to head + relation for arrays of entity and relation ids."""
+        self.ensure_loaded()
+        lhs = self.entity_emb[heads] + self.relation_emb[relations]  # add vectors according to TransE scoring function
+        ids, _ = self.entity_emb.nearest(lhs, k)
+        return ids
+
+    def top_k(self, lhs: np.ndarray, k: int = 1, candidates: np.ndarray | None = None) -> np.ndarray:
+        """Get the ids of the k entities nearest to lhs by exact search, nearest first, optionally among candidates."""
+        self.ensure_loaded()
+        dist = self.entity_emb.distances(lhs, candidates)  # compute distance to any candidate
+        k = min(k, len(dist))
+        # only the k best entities are ordered instead of sorting all distances
+        top = np.argpartition(dist, k - 1)[:k]
+        top = top[np.argsort(dist[top])]
+        return top if candidates is None else candidates[top]
+
+    def _build_candidates(self):
+        """Restrict every relation of the graph to the entities of the classes of its objects."""
+        start = datetime.now()
+        uris, instances = self._sparql_graph.range_instances()
+        ids = self.get_ids_for_ents(uris)
+        candidates = {}
+        for predicate, positions in instances.items():
+            rows = np.unique(ids[positions])
+            rows = rows[rows >= 0]
+            # relations with literal objects like dates have no typed entities to restrict to
+            if predicate.startswith(WDT) and len(rows):
+                candidates[predicate[len(WDT):]] = rows
+        self._candidates = candidates
+        print(f"Candidates built for {len(candidates)} relations after {datetime.now() - start}")
+
+    def get_candidates(self, relation: str) -> np.ndarray | None:
+        """
+        Get the sorted ids of the entities whose type is one of the types of the objects of a relation in the graph.
+
+        The candidates are built when the graph loads, None if the relation cannot be restricted.
+        """
+        if not settings.embeddings_type_filter:
+            return None
+        return self._candidates.get(relation)
+
+    def _entity_row(self, entity_uri: str) -> int:
+        _id = self.get_id_for_ent(entity_uri)
+        if _id < 0:
+            raise KeyError(f"No embedding for entity {entity_uri}")
+        return _id
+
+    def _relation_row(self, relation_uri: str) -> int:
+        _id = self.get_id_for_rel(relation_uri)
+        if _id < 0:
+            raise KeyError(f"No embedding for relation {relation_uri}")
+        return _id
+
     # Metadata access methods
     def get_id_for_ent(self, entity_uri: str) -> int:
         """Get id for a given entity URI."""
-        entity_uri = URIRef(entity_uri)
-        return self.ent2id.get(entity_uri, -1)
+        return self.entity_ids.id_for(entity_uri) if self.entity_ids is not None else -1
+
+    def get_ids_for_ents(self, entity_uris) -> np.ndarray:
+        """Get the ids of many entity URIs at once, -1 for entities without an embedding."""
+        entity_uris = list(entity_uris)
+        if self.entity_ids is None:
+            return np.full(len(entity_uris), -1, dtype=np.int64)
+        return self.entity_ids.ids_for(entity_uris)
 
     def get_ent_for_id(self, _id: int) -> str:
         """Get entity URI for a given id."""
-        return str(self.id2ent.get(_id, "Unknown Entity"))
+        uri = self.entity_ids.uri_for(_id) if self.entity_ids is not None else None
+        return uri if uri is not None else "Unknown Entity"
 
     def get_id_for_rel(self, relation_uri: str) -> int:
         """Get id for a given relation URI."""
-        relation_uri = URIRef(relation_uri)
-        return self.rel2id.get(relation_uri, -1)
+        return self.relation_ids.id_for(relation_uri) if self.relation_ids is not None else -1
 
     def get_rel_for_id(self, _id: int) -> str:
         """Get relation URI for a given id."""
-        return str(self.id2rel.get(_id, "Unknown Relation"))
+        uri = self.relation_ids.uri_for(_id) if self.relation_ids is not None else None
+        return uri if uri is not None else "Unknown Relation"
 
     def get_entities_ids(self) -> list:
         """Get all entity ids from the embeddings."""
-        return list(self.id2ent.keys())
+        return self.entity_ids.all_ids() if self.entity_ids is not None else []
 
     def get_relations_ids(self) -> list:
         """Get all relation ids from the embeddings."""
-        return list(self.id2rel.keys())
+        return self.relation_ids.all_ids() if self.relation_ids is not None else []
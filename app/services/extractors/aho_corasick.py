@@ -0,0 +1,88 @@
+import re
+from collections import deque
+
+# Characters which end a word for the full word check of the extractors, every one of them is a token of its own
+WORD_BOUNDARIES = {' ', "'", '"', '.', ','}
+_TOKEN = re.compile(r"""[^ '".,]+|[ '".,]""")
+
+
+class AhoCorasick:
+    """
+    Aho–Corasick automaton over tokenized patterns, finding all full-word occurrences in one pass over a text.
+
+    Texts and patterns are split into words and single boundary characters, so the automaton has one state per
+    distinct token prefix of the patterns instead of one per character prefix. Transitions are kept in one flat dict
+    keyed by `state * vocabulary + token`.
+    """
+
+    def __init__(self, patterns: dict[str, list[str]]):
+        """Build the automaton from a mapping of pattern -> labels (e.g. the entity types the pattern belongs to)."""
+        self.tokens: dict[str, int] = {}
+        tokenized = {pattern: [self.tokens.setdefault(token, len(self.tokens)) for token in _TOKEN.findall(pattern)]
+                     for pattern in patterns}
+        self.vocabulary = max(len(self.tokens), 1)
+
+        self.goto: dict[int, int] = {}
+        self.depths = [0]  # length in characters of the token prefix of every state
+        self.outputs: dict[int, list[tuple[str, str]]] = {}  # state -> (pattern, label) ending there
+        for pattern, token_ids in tokenized.items():
+            if not token_ids:
+                continue
+            state = 0
+            for token_id in token_ids:
+                key = state * self.vocabulary + token_id
+                if key not in self.goto:
+                    self.goto[key] = len(self.depths)
+                    self.depths.append(0)
+                state = self.goto[key]
+            self.depths[state] = len(pattern)
+            self.outputs.setdefault(state, []).extend((pattern, label) for label in patterns[pattern])
+
+        self._build_links()
+
+    def _build_links(self):
+        """Compute the failure links and the links to the next state with an output, breadth first."""
+        children: dict[int, list[tuple[int, int]]] = {}
+        for key, child in self.goto.items():
+            children.setdefault(key // self.vocabulary, []).append((key % self.vocabulary, child))
+
+        self.fail = [0] * len(self.depths)
+        self.output_link = [-1] * len(self.depths)
+        queue = deque(child for _, child in children.get(0, []))
+        while queue:
+            state = queue.popleft()
+            for token_id, child in children.get(state, []):
+                fallback = self.fail[state]
+                while fallback and fallback * self.vocabulary + token_id not in self.goto:
+                    fallback = self.fail[fallback]
+                target = self.goto.get(fallback * self.vocabulary + token_id, 0)
+                self.fail[child] = target if target != child else 0
+                self.output_link[child] = self.fail[child] if self.fail[child] in self.outputs \
+                    else self.output_link[self.fail[child]]
+                queue.append(child)
+
+    def find(self, text: str) -> list[dict]:
+        """Find all full-word occurrences of the patterns in a text as (pattern, label, start, end) dicts."""
+        matches = []
+        state = 0
+        position = 0
+        for token in _TOKEN.findall(text):
+            position += len(token)
+            token_id = self.tokens.get(token)
+            if token_id is None:
+                state = 0  # the token occurs in no pattern
+                continue
+            while state and state * self.vocabulary + token_id not in self.goto:
+                state = self.fail[state]
+            state = self.goto.get(state * self.vocabulary + token_id, 0)
+
+            output = state if state in self.outputs else self.output_link[state]
+            while output > 0:
+                start = position - self.depths[output]
+                # patterns starting or ending with a boundary character still need a boundary around them
+                if (start == 0 or text[start - 1] in WORD_BOUNDARIES) and \
+                        (position == len(text) or text[position] in WORD_BOUNDARIES):
+                    matches += [{"pattern": pattern, "label": label, "start": start, "end": position}
+                                for pattern, label in self.outputs[output]]
+                output = self.output_link[output]
+        return matches
@@ -0,0 +1,76 @@
+import re
+
+import numpy as np
+from rapidfuzz import fuzz, process
+from rapidfuzz.distance import ScoreAlignment
+
+_NON_WORD = re.compile(r"[^\w\s]")
+
+
+class FuzzyIndex:
+    """
+    Trigram inverted index over candidate strings for fuzzy substring matching.
+
+    A message is only compared with the candidates sharing at least `min_overlap` of their trigrams (or of the
+    message's trigrams, if the message is shorter) with it. These are scored in one `process.cdist` call and only the
+    candidates above the cutoff get their alignment computed.
+    """
+
+    def __init__(self, candidates: list[str], q: int = 3, min_overlap: float = 0.2):
+        self.candidates = candidates
+        self.q = q
+        self.min_overlap = min_overlap
+        self.gram_ids: dict[str, int] = {}
+
+        grams, owners = [], []
+        self.gram_counts = np.zeros(len(candidates), dtype=np.int32)  # distinct trigrams per candidate
+        for idx, candidate in enumerate(candidates):
+            candidate_grams = self._grams(candidate)
+            self.gram_counts[idx] = len(candidate_grams)
+            for gram in candidate_grams:
+                grams.append(self.gram_ids.setdefault(gram, len(self.gram_ids)))
+                owners.append(idx)
+
+        # CSR posting lists: the candidates containing trigram g are postings[offsets[g]:offsets[g + 1]], ascending
+        grams = np.array(grams, dtype=np.int64)
+        order = np.argsort(grams, kind="stable")
+        self.postings = np.array(owners, dtype=np.int32)[order]
+        self.offsets = np.zeros(len(self.gram_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(grams, minlength=len(self.gram_ids)), out=self.offsets[1:])
+
+    def __len__(self) -> int:
+        return len(self.candidates)
+
+    def _grams(self, text: str) -> set[str]:
+        # punctuation separates words like spaces do, padding gives short candidates and word boundaries own trigrams
+        text = f" {_NON_WORD.sub(' ', text)} "
+        return {text[i:i + self.q] for i in range(len(text) - self.q + 1)}
+
+    def lookup(self, text: str) -> np.ndarray:
+        """Get the ids of the candidates sharing enough trigrams with a text, ascending."""
+        gram_ids = [self.gram_ids[gram] for gram in self._grams(text) if gram in self.gram_ids]
+        if not gram_ids:
+            return np.empty(0, dtype=np.int64)
+        owners = np.concatenate([self.postings[self.offsets[g]:self.offsets[g + 1]] for g in gram_ids])
+        shared = np.bincount(owners, minlength=len(self.candidates))
+        required = np.maximum(1, np.ceil(self.min_overlap * np.minimum(self.gram_counts, len(gram_ids))))
+        return np.flatnonzero(shared >= required)
+
+    def match(self, text: str, score_cutoff: float) -> list[tuple[str, ScoreAlignment]]:
+        """
+        Get the candidates whose `fuzz.partial_ratio_alignment` with the text reaches the cutoff, with the alignment.
+
+        The candidates are returned in their original order.
+        """
+        ids = self.lookup(text)
+        if not len(ids):
+            return []
+        selected = [self.candidates[idx] for idx in ids.tolist()]
+        scores = process.cdist([text], selected, scorer=fuzz.partial_ratio, processor=None, score_cutoff=score_cutoff)[0]
+
+        matches = []
+        for idx in np.flatnonzero(scores).tolist():
+            alignment = fuzz.partial_ratio_alignment(selected[idx], text, processor=None, score_cutoff=score_cutoff)
+            if alignment is not None:
+                matches.append((selected[idx], alignment))
+        return matches
@@ -1,11 +1,19 @@
 import os
 import json
+from functools import lru_cache
 import spacy
 from app.config.app import settings
 import re
 from rapidfuzz import process, fuzz
 import regex
 
+from app.services.extractors.aho_corasick import AhoCorasick
+from app.services.extractors.fuzzy_index import FuzzyIndex
+from app.services.sparql_graph import SPARQLGraph
+
+# en and em dashes are matched as hyphens by the indexes, in the names as well as in the messages
+DASHES = str.maketrans("–—", "--")
+
 class Extractor:
     def __init__(self):
         self.map = {}
@@ -23,7 +31,7 @@ class Extractor:
             self.map["person"] = {person.lower(): person for person in self.persons}
 
 class SpacyExtractor(Extractor):
-    def __init__(self):
+    def __init__(self, sparql_graph: SPARQLGraph | None = None):
         # Load the spaCy model from the saved path
         path = os.sep.join((
             settings.utils_path,
@@ -34,8 +42,25 @@ class SpacyExtractor(Extractor):
         self.nlp = spacy.load(path)
         self.score_threshold_with_nltk = 90  # Threshold with NLTK matches
         self.score_threshold_without_nltk = 80  # Threshold without NLTK matches
-        self.hyphen_variants = ['-', '–', '—']
+        self.short_name_length = 5  # shorter names are mostly common words like "it" or "tell"
+        self.sparql_graph = sparql_graph  # resolves names differing only in their dashes to their entities
         super().__init__()  # Get relations and entities from the parent class
+        # the indexes hold the lowercase keys with folded dashes, this maps them back to all keys of self.map
+        self.normalized_keys = {}
+        for type, keys in self.map.items():
+            self.normalized_keys[type] = {}
+            for key in keys:
+                self.normalized_keys[type].setdefault(key.translate(DASHES), []).append(key)
+        # trigram indexes over the keys, so a message is only aligned with candidates sharing enough trigrams
+        self.fuzzy_index = {type: FuzzyIndex(list(keys)) for type, keys in self.normalized_keys.items()}
+        # one automaton over the keys of all types for the exact pre-pass
+        patterns = {}
+        for type, keys in self.normalized_keys.items():
+            for key in keys:
+                patterns.setdefault(key, []).append(type)
+        self.exact_index = AhoCorasick(patterns)
+        # results per (lowercase text, type), the same questions and names come up again and again
+        self.extract_entities = lru_cache(maxsize=settings.extraction_cache_size)(self._extract_entities)
 
     def preprocess_text(self, text: str) -> str:
         # Standardize text: lowercase and handle colons
@@ -43,51 +68,47 @@ class SpacyExtractor(Extractor):
         text = re.sub(r":", ":", text)  # This line seems redundant but kept for consistency
         return text
 
-    def generate_hyphen_variants(self, text: str) -> list:
-        """
-        Generate all mutated versions of the input text by replacing hyphens with different variants.
-        """
-        hyphen_pattern = r'[-–—]'
-        if not re.search(hyphen_pattern, text):
-            return [text]  # No hyphens to replace
-
-        # Generate mutated texts by replacing all hyphens with each variant
-        mutated_texts = []
-        for variant in self.hyphen_variants:
-            mutated = re.sub(hyphen_pattern, variant, text)
-            mutated_texts.append(mutated)
-        return mutated_texts
-
     def get_entities_with_fuzzy_matching(self, text: str, type: str) -> dict:
         if type not in ['movie', 'relation', 'person']:
             raise ValueError(f"Invalid type '{type}' specified. Must be one of 'movie', 'relation', 'person', or 'all'.")
         
         text = self.preprocess_text(text)  # Preprocess the text for consistent matching
+        combined_results = list(self.extract_entities(text, type))
 
-        # Generate all hyphen variants
-        mutated_texts = self.generate_hyphen_variants(text)
-
-        nltk_matches_all_variants = []
-        fuzzy_matches_all_variants = []
-
-        for mutated_text in mutated_texts:
-            print(f"Mutated text: {mutated_text}")
-            # Get NLTK matches for the mutated text
-            nltk_matches = self.get_nltk_matches(mutated_text, type)
-            nltk_matches_all_variants.extend(nltk_matches)
-            print(f"NLTK matches: {nltk_matches}")
+        # Return results grouped by type
+        return {
+            "movie": combined_results if type == "movie" else [],
+            "relation": combined_results if type == "relation" else [],
+            "person": combined_results if type == "person" else [],
+        }
 
-            # Get fuzzy matches for the mutated text
+    def _extract_entities(self, text: str, type: str) -> tuple:
+        """
+        Extract the names of one type from a preprocessed text, cached in `extract_entities`.
+        """
+        # Get NLTK matches for the text, the patterns of the model are written with the original dashes
+        nltk_matches = self.get_nltk_matches(text, type)
+        print(f"NLTK matches: {nltk_matches}")
+
+        # Fold en and em dashes into hyphens for the indexes, "Spider–Man" and "Spider-Man" are the same name.
+        # The folding keeps the length of the text, so the offsets of all matches refer to both texts
+        folded_text = text.translate(DASHES)
+
+        # Names occurring verbatim are taken as they are, the fuzzy scan only looks at the rest of the text.
+        # Short names stay in the text, they may as well be part of a longer misspelled name
+        exact_matches = self.get_exact_matches(folded_text, type)
+        fuzzy_matches = []
+        uncovered = self.mask_matches(folded_text, [match for match in exact_matches
+                                             if len(match["original_text"]) >= self.short_name_length])
+        if uncovered.strip():
             score = self.score_threshold_with_nltk if nltk_matches else self.score_threshold_without_nltk
-            fuzzy_matches = self.get_fuzzy_matches(mutated_text, type, default_score=score)
-            fuzzy_matches_all_variants.extend(fuzzy_matches)
-            
-            print(f"Fuzzy matches: {fuzzy_matches}")
+            fuzzy_matches = self.get_fuzzy_matches(uncovered, type, default_score=score)
+        fuzzy_matches = exact_matches + fuzzy_matches
 
-        # Combine matches from all variants
-        combined_results = self.combine_and_sort_matches(
-            nltk_matches_all_variants, fuzzy_matches_all_variants
-        )
+        print(f"Fuzzy matches: {fuzzy_matches}")
+
+        # Combine matches from spaCy and the fuzzy matching
+        combined_results = self.combine_and_sort_matches(nltk_matches, fuzzy_matches)
 
         # filter out weird words
         # if there are more than 1 results and one of them is "tell" remove it
@@ -98,19 +119,30 @@ class SpacyExtractor(Extractor):
         
 
         # transform all results into their uppercase version -> then they are only array
-        combined_results = self.convert_to_correct_name(combined_results, type)
-
-        # Return results grouped by type
-        return {
-            "movie": combined_results if type == "movie" else [],
-            "relation": combined_results if type == "relation" else [],
-            "person": combined_results if type == "person" else [],
-        }
+        return tuple(self.convert_to_correct_name(combined_results, type, text))
     
-    # convert to correct uppernamed name, everything now was done on lowercase
-    def convert_to_correct_name(self, matches, type):
-
-        return [self.map[type][match['original_text'].lower()] for match in matches]
+    # convert to correct uppernamed name, everything now was done on lowercase with folded dashes
+    def convert_to_correct_name(self, matches, type, text):
+        names = []
+        for match in matches:
+            key = match['original_text'].lower()
+            originals = self.normalized_keys[type].get(key.translate(DASHES), [key])
+            # names differing only in their dashes are told apart by the dashes of the text,
+            # else one name is kept per entity they stand for
+            written = text[match['start']:match['end']]
+            names.extend(self.map[type][original] for original in
+                          ([written] if written in originals else self.distinct_entities(originals, type)))
+        return names
+
+    def distinct_entities(self, keys, type):
+        """Keep the first of the keys resolving to the same entity, all keys are one entity without a graph."""
+        if len(keys) == 1 or self.sparql_graph is None:
+            return keys[:1]
+        resolve = self.sparql_graph.get_rel_for_lbl if type == 'relation' else self.sparql_graph.get_ent_for_lbl
+        distinct = {}
+        for key in keys:
+            distinct.setdefault(resolve(self.map[type][key]), key)
+        return list(distinct.values())
 
     def get_nltk_matches(self, text, type):
         """
@@ -165,33 +197,46 @@ class SpacyExtractor(Extractor):
         return filtered_matches
     
 
+    def get_exact_matches(self, text, type):
+        """
+        Extract entities occurring as full words in the text, in the same format as the fuzzy matches.
+        """
+        matches = [{
+            "match_text": text[match["start"]:match["end"]],
+            "original_text": match["pattern"],
+            "label": type,
+            "score": 100,
+            "start": match["start"],
+            "end": match["end"],
+            "is_full_word": True
+        } for match in self.exact_index.find(text) if match["label"] == type]
+
+        # keep the longest of overlapping matches, e.g. "the godfather part ii" over "the godfather"
+        matches = sorted(matches, key=lambda x: (-len(x["original_text"]), x["start"]))
+        matches = self.filter_overlapping_matches(matches)
+        print(f"Exact matches: {matches}")
+
+        return matches
+
+    def mask_matches(self, text, matches):
+        """
+        Blank out the spans of matches, keeping the offsets of the rest of the text.
+        """
+        for match in matches:
+            text = text[:match["start"]] + " " * (match["end"] - match["start"]) + text[match["end"]:]
+        return text
+
     def get_fuzzy_matches(self, text, type, default_score:int = 90 ):
         """
         Extract entities using fuzzy matching.
         """
         text += " "  # Add a space at the end to ensure full word matches - works better 
-        matches = []
-        candidates = list(self.map[type].keys())
-
         threshold = default_score
 
         matches = []
 
-        alignment_result = fuzz.partial_ratio_alignment(
-                candidates, text, processor=None, score_cutoff=threshold
-        )
-
-        print(f"Alignment result: {alignment_result}")
-
-        for candidate in candidates:
-            # Compute alignment for each candidate
-            alignment_result = fuzz.partial_ratio_alignment(
-                candidate, text, processor=None, score_cutoff=threshold
-            )
-
-            if alignment_result is None:
-                continue  # Skip if no match found
-
+        # Only the indexed candidates scoring above the threshold are aligned, each of them once
+        for candidate, alignment_result in self.fuzzy_index[type].match(text, threshold):
             score = alignment_result.score
             # src_start = alignment_result.src_start
             # src_end = alignment_result.src_end
@@ -199,7 +244,7 @@ class SpacyExtractor(Extractor):
             dest_end = alignment_result.dest_end
 
             # for short words take long threshold, ignoring the etc not possible
-            curr_threshold = threshold if len(candidate) >= 5 else 95
+            curr_threshold = threshold if len(candidate) >= self.short_name_length else 95
             
             if score >= curr_threshold:
                 # Extract the matching substring from the input text
@@ -254,8 +299,8 @@ class SpacyExtractor(Extractor):
                 # original_text = self.map[type][candidate]
                 matches.append({
                     "match_text": matching_substring,  # Substring from the input text
-                    "original_text": candidate,    # Original candidate text
-                    "label": self.get_candidate_type(candidate),
+                    "original_text": candidate,    # Original candidate text, with folded dashes
+                    "label": self.get_candidate_type(self.normalized_keys[type][candidate][0]),
                     "score": score,
                     "start": dest_start,
                     "end": dest_end,
@@ -306,12 +351,10 @@ class SpacyExtractor(Extractor):
         Determine the type of a candidate entity.
         """
         candidate_lower = candidate.lower()
-        if candidate_lower in map(str.lower, self.entities):
-            return "movie"
-        elif candidate_lower in map(str.lower, self.relations):
-            return "relation"
-        elif candidate_lower in map(str.lower, self.persons):
-            return "person"
+        # the maps are keyed by the lowercase names, so this is a lookup instead of a scan over all names
+        for type in ("movie", "relation", "person"):
+            if candidate_lower in self.map[type]:
+                return type
         return "unknown"
 
     def combine_and_sort_matches(self, nltk_matches, fuzzy_matches):
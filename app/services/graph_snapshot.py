@@ -0,0 +1,262 @@
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+from rdflib import Graph
+from rdflib.term import Node
+from rdflib.util import from_n3
+
+try:
+    import fcntl
+except ImportError:  # Windows, snapshots are then built without coordination between processes
+    fcntl = None
+
+
+class TermDictionary:
+    """Interned, sorted UTF-8 string table mapping strings to dense integer ids."""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob  # concatenated UTF-8 bytes of all strings
+        self.offsets = offsets  # offsets[i]:offsets[i + 1] is the byte range of string i
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @classmethod
+    def from_strings(cls, strings) -> "TermDictionary":
+        """Build a dictionary from an iterable of strings; ids follow the sorted order of the strings."""
+        encoded = [s.encode("utf-8") for s in sorted(set(strings))]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(blob, offsets)
+
+    def _bytes_at(self, idx: int) -> bytes:
+        return self.blob[self.offsets[idx]:self.offsets[idx + 1]].tobytes()
+
+    def decode(self, idx: int) -> str:
+        """Get the string for a given id."""
+        return self._bytes_at(idx).decode("utf-8")
+
+    def decode_many(self, ids: np.ndarray) -> list[str]:
+        """Get the strings of many ids at once, slicing the blob without per-id array indexing."""
+        ids = np.asarray(ids, dtype=np.int64)
+        offsets = np.asarray(self.offsets)
+        blob = memoryview(np.asarray(self.blob))
+        return [str(blob[start:end], "utf-8") for start, end in zip(offsets[ids].tolist(), offsets[ids + 1].tolist())]
+
+    def lookup(self, string: str) -> int:
+        """Get the id for a given string, -1 if it is not interned."""
+        # UTF-8 byte order equals code point order, so a binary search on the raw bytes is valid
+        key = string.encode("utf-8")
+        low, high = 0, len(self)
+        while low < high:
+            mid = (low + high) // 2
+            if self._bytes_at(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < len(self) and self._bytes_at(low) == key:
+            return low
+        return -1
+
+    def arrays(self, name: str) -> dict[str, np.ndarray]:
+        """Get the arrays of the dictionary under the given name, for `write_arrays`."""
+        return {f"{name}_blob": self.blob, f"{name}_offsets": self.offsets}
+
+    @classmethod
+    def from_arrays(cls, arrays: dict[str, np.ndarray], name: str) -> "TermDictionary":
+        return cls(arrays[f"{name}_blob"], arrays[f"{name}_offsets"])
+
+
+def term_to_key(term: Node) -> str:
+    """Serialize an RDF term to the N3 string used as dictionary key."""
+    return term.n3()
+
+
+def key_to_term(key: str) -> Node:
+    """Parse an N3 dictionary key back to an RDF term."""
+    return from_n3(key)
+
+
+def file_checksum(path: str, chunk_size: int = 1 << 23) -> str:
+    """Compute the SHA-256 checksum of a file, only once as long as its size and modification time are unchanged."""
+    stat = os.stat(path)
+    return _file_checksum(os.path.abspath(path), stat.st_size, stat.st_mtime_ns, chunk_size)
+
+
+def file_signature(path: str) -> str:
+    """Identify a file by its size and modification time, for files too large to hash on every start."""
+    stat = os.stat(path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+@lru_cache(maxsize=64)
+def _file_checksum(path: str, size: int, mtime_ns: int, chunk_size: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextmanager
+def file_lock(path: str):
+    """Hold an exclusive lock on a lock file, so that only one process at a time builds the same files."""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def write_arrays(directory: str, arrays: dict[str, np.ndarray], meta: dict, meta_file: str = "meta.json"):
+    """
+    Write named arrays and a meta file into a directory.
+
+    The meta file is removed first and written last, so a partially written directory is never read back.
+    """
+    os.makedirs(directory, exist_ok=True)
+    meta_path = os.path.join(directory, meta_file)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f"{name}.npy"), array)
+    with open(meta_path, "w") as file:
+        json.dump(meta, file)
+
+
+def read_meta(directory: str, version: int, source_checksum: str, meta_file: str = "meta.json") -> dict | None:
+    """Read the meta file written by `write_arrays`, None if it is missing or belongs to another version or source."""
+    try:
+        with open(os.path.join(directory, meta_file), "r") as file:
+            meta = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if meta.get("version") != version or meta.get("source_checksum") != source_checksum:
+        return None
+    return meta
+
+
+def read_arrays(directory: str, names, mmap_mode: str | None = "r") -> dict[str, np.ndarray]:
+    """Load arrays written by `write_arrays`, memory-mapped unless `mmap_mode` is None."""
+    return {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode) for name in names}
+
+
+def load_or_build(path: str, load, build, save):
+    """
+    Load the files derived from a source, building and saving them first if `load` finds none.
+
+    Only one process at a time builds the files at a path, the others wait and load what it wrote. The built object is
+    loaded again after saving, so every process uses the same (possibly memory-mapped) files.
+    """
+    with file_lock(path + ".lock"):
+        loaded = load()
+        if loaded is not None:
+            return loaded
+        built = build()
+        try:
+            save(built)
+        except OSError as e:
+            print(f"Failed to write {path}: {e}")
+            return built
+        loaded = load()
+        return built if loaded is None else loaded
+
+
+def language_matches(tag: str, lang: str) -> bool:
+    """Compare the primary subtag of a language tag with a language case-insensitively, "EN-gb" matches "en"."""
+    return tag.lower().split("-")[0] == lang.lower()
+
+
+def literal_language(key: str) -> str | None:
+    """Get the language tag of a dictionary key, None if it is not a language-tagged literal."""
+    # the tag follows the closing quote, '"@' inside the text is escaped, so keys without it are never parsed
+    if not key.startswith('"') or '"@' not in key:
+        return None
+    return getattr(key_to_term(key), "language", None)
+
+
+def _is_foreign_literal(key: str, lang: str) -> bool:
+    """Check whether a dictionary key is a literal with a language tag other than the given one."""
+    language = literal_language(key)
+    return language is not None and not language_matches(language, lang)
+
+
+class GraphSnapshot:
+    """Compiled binary form of an RDF graph: a term dictionary plus an (N, 3) array of term ids."""
+    VERSION = 2
+
+    def __init__(self, terms: TermDictionary, triples: np.ndarray):
+        self.terms = terms
+        self.triples = triples
+
+    def __len__(self) -> int:
+        return len(self.triples)
+
+    @classmethod
+    def from_graph(cls, graph: Graph) -> "GraphSnapshot":
+        """Dictionary-encode all triples of an rdflib graph."""
+        triples = list(graph)
+        keys = sorted({term_to_key(term) for triple in triples for term in triple})
+        terms = TermDictionary.from_strings(keys)
+        ids = {key: idx for idx, key in enumerate(keys)}
+        encoded = np.fromiter(
+            (ids[term_to_key(term)] for triple in triples for term in triple),
+            dtype=np.int32,
+            count=3 * len(triples)
+        ).reshape(-1, 3)
+        return cls(terms, encoded)
+
+    def project(self, predicates: set[str], lang: str = "en") -> "GraphSnapshot":
+        """
+        Keep only the triples with one of the given predicate keys whose object is not a literal in another language.
+
+        Terms which no longer occur in any triple are dropped from the dictionary.
+        """
+        predicate_ids = [term_id for term_id in map(self.terms.lookup, predicates) if term_id >= 0]
+        keep = np.isin(self.triples[:, 1], predicate_ids)
+
+        # drop literals tagged with another language, plain and typed literals are kept
+        objects = np.unique(self.triples[keep, 2])
+        foreign = [term_id for term_id in objects.tolist() if _is_foreign_literal(self.terms.decode(term_id), lang)]
+        keep &= ~np.isin(self.triples[:, 2], foreign)
+        triples = self.triples[keep]
+
+        # ids are assigned in key order, so the used ids keep their relative order in the compacted dictionary
+        used = np.unique(triples)
+        terms = TermDictionary.from_strings(self.terms.decode(term_id) for term_id in used.tolist())
+        return GraphSnapshot(terms, np.searchsorted(used, triples).astype(np.int32))
+
+    def to_graph(self) -> Graph:
+        """Materialize the snapshot as an in-memory rdflib graph."""
+        graph = Graph()
+        decoded = [key_to_term(self.terms.decode(idx)) for idx in range(len(self.terms))]
+        graph.addN((decoded[s], decoded[p], decoded[o], graph) for s, p, o in self.triples.tolist())
+        return graph
+
+    def save(self, directory: str, source_checksum: str):
+        write_arrays(directory, {**self.terms.arrays("terms"), "triples": self.triples}, {
+            "version": self.VERSION,
+            "source_checksum": source_checksum,
+            "terms": len(self.terms),
+            "triples": len(self.triples),
+            "created": datetime.now().isoformat()
+        })
+
+    @classmethod
+    def load(cls, directory: str, source_checksum: str) -> "GraphSnapshot | None":
+        """Memory-map a snapshot, None if it does not exist or was built from a different source file."""
+        if read_meta(directory, cls.VERSION, source_checksum) is None:
+            return None
+        arrays = read_arrays(directory, ["terms_blob", "terms_offsets", "triples"])
+        return cls(TermDictionary.from_arrays(arrays, "terms"), arrays["triples"])
@@ -0,0 +1,86 @@
+import csv
+
+import numpy as np
+
+from app.services.graph_snapshot import TermDictionary, read_arrays, read_meta, write_arrays
+
+
+class IdMapping:
+    """
+    Bidirectional mapping between URIs and embedding ids without per-entry Python objects.
+
+    The URIs are kept in a sorted string table, `ids[i]` is the embedding id of URI i and `uris[_id]` the table index
+    of the URI with embedding id `_id` (-1 for ids without a URI).
+    """
+    VERSION = 1
+
+    def __init__(self, terms: TermDictionary, ids: np.ndarray, uris: np.ndarray):
+        self.terms = terms
+        self.ids = ids
+        self.uris = uris
+        self._keys: np.ndarray | None = None  # fixed-width copy of the URI table for batch lookups, built on first use
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    @classmethod
+    def from_del(cls, path: str) -> "IdMapping":
+        """Read a tab separated `id<TAB>uri` file as written by the embedding training."""
+        with open(path, "r") as file:
+            entries = {uri: int(idx) for idx, uri in csv.reader(file, delimiter="\t")}
+        terms = TermDictionary.from_strings(entries)
+        ids = np.fromiter((entries[terms.decode(i)] for i in range(len(terms))), dtype=np.int32, count=len(terms))
+        uris = np.full(ids.max() + 1 if len(ids) else 0, -1, dtype=np.int32)
+        uris[ids] = np.arange(len(ids), dtype=np.int32)
+        return cls(terms, ids, uris)
+
+    def id_for(self, uri: str) -> int:
+        """Get the embedding id of a URI, -1 if it has none."""
+        idx = self.terms.lookup(str(uri))
+        return int(self.ids[idx]) if idx >= 0 else -1
+
+    def _fixed_width_keys(self) -> np.ndarray:
+        """Get the URIs as a sorted array of null-padded byte strings, whose order equals the order of the table."""
+        if self._keys is None:
+            offsets = np.asarray(self.terms.offsets)
+            lengths = np.diff(offsets)
+            width = max(int(lengths.max()) if len(lengths) else 0, 1)
+            padded = np.zeros((len(lengths), width), dtype=np.uint8)
+            rows = np.repeat(np.arange(len(lengths)), lengths)
+            padded[rows, np.arange(len(rows)) - np.repeat(offsets[:-1] - offsets[0], lengths)] = \
+                self.terms.blob[offsets[0]:offsets[-1]]
+            self._keys = padded.view(f"S{width}").reshape(-1)
+        return self._keys
+
+    def ids_for(self, uris) -> np.ndarray:
+        """Get the embedding ids of many URIs with one vectorized binary search, -1 for URIs without one."""
+        keys = self._fixed_width_keys()
+        encoded = [str(uri).encode("utf-8") for uri in uris]
+        # longer URIs cannot be in the table, the conversion to the fixed width would truncate them
+        fits = np.fromiter((len(uri) <= keys.itemsize for uri in encoded), dtype=bool, count=len(encoded))
+        queries = np.array(encoded, dtype=keys.dtype) if encoded else np.empty(0, dtype=keys.dtype)
+        positions = np.minimum(np.searchsorted(keys, queries), max(len(keys) - 1, 0))
+        found = fits & (keys[positions] == queries) if len(keys) else np.zeros(len(encoded), dtype=bool)
+        return np.where(found, np.asarray(self.ids)[positions] if len(keys) else -1, -1).astype(np.int64)
+
+    def uri_for(self, _id: int) -> str | None:
+        """Get the URI of an embedding id, None if the id is unknown."""
+        if not 0 <= _id < len(self.uris) or self.uris[_id] < 0:
+            return None
+        return self.terms.decode(int(self.uris[_id]))
+
+    def all_ids(self) -> list[int]:
+        """Get all embedding ids which have a URI."""
+        return np.flatnonzero(np.asarray(self.uris) >= 0).tolist()
+
+    def save(self, directory: str, source_checksum: str):
+        write_arrays(directory, {**self.terms.arrays("uris"), "ids": self.ids, "id_uris": self.uris},
+                     {"version": self.VERSION, "source_checksum": source_checksum})
+
+    @classmethod
+    def load(cls, directory: str, source_checksum: str, mmap_mode: str | None = None) -> "IdMapping | None":
+        """Load a saved mapping, None if it is missing or was built from another file."""
+        if read_meta(directory, cls.VERSION, source_checksum) is None:
+            return None
+        arrays = read_arrays(directory, ["uris_blob", "uris_offsets", "ids", "id_uris"], mmap_mode)
+        return cls(TermDictionary.from_arrays(arrays, "uris"), arrays["ids"], arrays["id_uris"])
@@ -1,6 +1,6 @@
 from app.services.disambiguation_service import DisambiguationService
 from app.services.question_classifier import QuestionCategory
-from app.services.sparql_graph import SPARQLGraph
+from app.services.sparql_graph import SPARQLGraph, WD, WDT
 from app.services.answering_service import AnsweringService
 from app.services.extractors.main import SpacyExtractor
 
@@ -8,20 +8,47 @@ import random
 import os
 from app.config.app import settings
 import json
+import threading
 import time
 
 
 class ImageFinder(AnsweringService):
 
     # init with sparql graph
-    def __init__(self, sparql_graph: SPARQLGraph, disambiguation: DisambiguationService, spacy_extractor: SpacyExtractor):
+    def __init__(self, sparql_graph: SPARQLGraph, disambiguation: DisambiguationService, spacy_extractor: SpacyExtractor,
+                 lazy_load: bool = False):
         self.sparql_graph: SPARQLGraph = sparql_graph
         self.disambiguation: DisambiguationService = disambiguation
         self.spacy_extractor: SpacyExtractor = spacy_extractor
 
         self.imdb_to_images = {}
         self.movie_to_poster = {}
-        self._load_metadata()
+        self._load_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._background_load = False  # set when a loader thread owns the load
+        if not lazy_load:
+            self.ensure_loaded()
+
+    def ensure_loaded(self):
+        """Lazy-load the image metadata if it wasn't loaded initially, blocking until it is available."""
+        if self._ready.is_set():
+            return
+        with self._load_lock:
+            if not self._ready.is_set():
+                self._load_metadata()
+                self._ready.set()
+
+    def is_ready(self) -> bool:
+        """Check whether the image metadata is loaded."""
+        return self._ready.is_set()
+
+    def load_in_background(self):
+        """Leave the load to a loader thread."""
+        self._background_load = True
+
+    def is_loading_in_background(self) -> bool:
+        """Check whether the loader thread has not loaded the image metadata yet."""
+        return self._background_load and not self._ready.is_set()
 
     def _load_metadata(self):
         start_time = time.time()
@@ -48,26 +75,18 @@ class ImageFinder(AnsweringService):
 
     def get_image_for_imdb_id(self, imdb_id: str) -> str:
         """Fetch a random image for a person IMDb ID."""
+        self.ensure_loaded()
         return self._get_image(imdb_id, self.imdb_to_images)
 
     def get_image_for_movie_imdb_id(self, imdb_id: str) -> str:
         """Fetch a random poster for a movie IMDb ID."""
+        self.ensure_loaded()
         return self._get_image(imdb_id, self.movie_to_poster)
 
-    def _get_entity_imdb_id(self, entity: str) -> str:
-        """Helper function to construct and execute a SPARQL query to fetch an IMDb ID for a given entity."""
-        query = f"""
-        PREFIX wd: <http://www.wikidata.org/entity/>
-        PREFIX wdt: <http://www.wikidata.org/prop/direct/>
-        SELECT ?imdb_id
-        WHERE {{
-            wd:{entity} wdt:P345 ?imdb_id .
-        }}
-        """
-
-        response = self.sparql_graph.execute_query(query)
-
-        return response if isinstance(response, str) else None
+    def _get_entity_imdb_id(self, entity: str) -> str | None:
+        """Helper function to fetch an IMDb ID for a given entity."""
+        imdb_ids = self.sparql_graph.objects(WD[entity], WDT.P345)
+        return str(imdb_ids[0]) if imdb_ids else None
 
     def _get_entity_id(self, entity: str, entity_type: str):
         if entity_type == "person":
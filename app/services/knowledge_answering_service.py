@@ -9,7 +9,7 @@ from app.services.extractors.movie_extraction import MovieExtractor
 from app.services.extractors.relationship_extraction import RelationshipExtractor
 from app.services.llm_service import LlmService
 from app.services.question_classifier import QuestionCategory
-from app.services.sparql_graph import SPARQLGraph
+from app.services.sparql_graph import SPARQLGraph, WD, WDT
 from app.services.extractors.main import SpacyExtractor
 from app.services.answering_service import AnsweringService, SPARQLAnswerService
 
@@ -82,11 +82,20 @@ class EmbeddingAndKnowledgeAnswerService(AnsweringService):
         if answer_crowd:
             return self.make_human_response(entity_label, relation_label, answer_crowd, source="crowd")
 
+        # Until the graph is loaded in the background, only the crowd data can be used
+        if self._sparql_graph.is_loading_in_background():
+            return ("I am still loading my knowledge graph and could only check the crowd data so far. Please ask "
+                    "again in a moment.")
+
         # 5) Query the graph and return if we have an answer
         answer_graph = self.get_answer_from_graph(entity, relation)
         if answer_graph:
             return self.make_human_response(entity_label, relation_label, answer_graph)
 
+        if self._embeddings.is_loading_in_background():
+            return "I could not find an answer in my knowledge graph and my embeddings are still loading. Please ask " \
+                   "again in a moment."
+
         # 6) If we don't have an answer from the graph, try embeddings
         answer_embeddings = self.get_answer_from_embeddings(entity, relation)
         if answer_embeddings:
@@ -96,22 +105,19 @@ class EmbeddingAndKnowledgeAnswerService(AnsweringService):
                 "rephrasing and ask again.")
 
     def get_answer_from_graph(self, entity: str, relation: str = None) -> str:
-        query = f"""PREFIX wd: <http://www.wikidata.org/entity/>
-                    PREFIX wdt: <http://www.wikidata.org/prop/direct/>
-                    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-                    SELECT ?answerLabel
-                    WHERE {{
-                        wd:{entity} wdt:{relation} ?answer .
-                        BIND(IF(ISLITERAL(?answer), ?answer, ?answerLabel) AS ?answerLabel)
-                        OPTIONAL {{
-                            ?answer rdfs:label ?answerLabel .
-                            FILTER(LANG(?answerLabel) = "en")
-                        }}
-                    }}
-                    LIMIT 1"""
-
-        response = self._sparql_graph.execute_query(query)
-        return response
+        for answer in self._sparql_graph.objects(WD[entity], WDT[relation]):
+            label = self._sparql_graph.label(answer)
+            if label:
+                return label
+        return ""
+
+    def get_answers_from_graph(self, pairs: list[tuple[str, str]]) -> list[str]:
+        """Answer many (entity, relation) id pairs from the graph at once, aligned with the input pairs."""
+        answers = []
+        for objects in self._sparql_graph.objects_batch([(WD[entity], WDT[relation]) for entity, relation in pairs]):
+            labels = (self._sparql_graph.label(answer) for answer in objects)
+            answers.append(next((label for label in labels if label), ""))
+        return answers
 
     def get_answer_from_embeddings(self, entity: str, relation: str) -> str:
         response = self._embeddings.calculate_embeddings(entity, relation)
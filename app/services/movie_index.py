@@ -0,0 +1,167 @@
+import threading
+from datetime import datetime
+
+import numpy as np
+from rdflib import URIRef
+from rdflib.term import Node
+
+from app.services.sparql_graph import SPARQLGraph, WDT
+
+
+class _MovieTable:
+    """
+    One consistent version of the attribute table and its inverted index.
+
+    `build` creates a new table and publishes it with a single assignment, so readers always see a complete table.
+    Only the term dictionary grows afterwards, when movies outside the table are encoded, under the table's lock.
+    """
+
+    def __init__(self, terms: list[Node], movies: list[Node], offsets: np.ndarray, pairs: np.ndarray):
+        self.terms = terms
+        self.term_ids = {term: term_id for term_id, term in enumerate(terms)}
+        self.movies = movies
+        self.movie_rows = {movie: row for row, movie in enumerate(movies)}
+        self.offsets = offsets
+        self.pairs = pairs
+        self._lock = threading.Lock()
+
+        # invert the attribute table into (property, value) key -> ascending movie rows
+        movie_of_pair = np.repeat(np.arange(len(offsets) - 1, dtype=np.int32), np.diff(offsets))
+        order = np.lexsort((movie_of_pair, pairs))
+        keys = pairs[order]
+        self.postings = movie_of_pair[order]
+        self.posting_keys, starts = np.unique(keys, return_index=True)
+        self.posting_offsets = np.append(starts, len(keys)).astype(np.int64)
+
+    def intern(self, term: Node) -> int:
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            with self._lock:
+                term_id = self.term_ids.get(term)
+                if term_id is None:
+                    self.terms.append(term)
+                    term_id = self.term_ids[term] = len(self.terms) - 1
+        return term_id
+
+
+class MovieAttributeIndex:
+    """
+    Materialized attribute table of all movies: movie -> {property -> set(values)}, plus its inverted index.
+
+    The table is stored in CSR layout: the (property, value) pairs of movie row i are the sorted int64 keys
+    `pairs[offsets[i]:offsets[i + 1]]`, where a key packs the local ids of property and value as `property << 32 | value`.
+    Movie rows are numbered by descending rating, so the posting list of movie rows of every (property, value) key
+    is sorted by rating as well and the best candidates are always at the front.
+    """
+
+    def __init__(self, sparql_graph: SPARQLGraph):
+        self._sparql_graph = sparql_graph
+        self._table = _MovieTable([], [], np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self._table.movie_rows)
+
+    def _encode(self, movie: Node, intern) -> np.ndarray:
+        """Look up the attributes of a movie in the graph as sorted (property, value) keys."""
+        keys = {intern(p) << 32 | intern(o) for p, o in self._sparql_graph.predicate_objects(movie)}
+        return np.sort(np.fromiter(keys, dtype=np.int64, count=len(keys)))
+
+    def build(self):
+        """Materialize the attributes of every movie known to the graph metadata."""
+        start = datetime.now()
+        terms, term_ids = [], {}
+
+        def intern(term: Node) -> int:
+            term_id = term_ids.get(term)
+            if term_id is None:
+                term_id = term_ids[term] = len(terms)
+                terms.append(term)
+            return term_id
+
+        movies = self._sort_by_rating(sorted({URIRef(uri) for uri in self._sparql_graph.movie2id.values()}))
+        rows = [self._encode(movie, intern) for movie in movies]
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(row) for row in rows], out=offsets[1:])
+        pairs = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+        table = _MovieTable(terms, movies, offsets, pairs)
+        self._table = table
+        print(f"Movie attribute index built for {len(movies)} movies with {len(pairs)} attributes and "
+              f"{len(table.posting_keys)} posting lists after {datetime.now() - start}")
+
+    def _sort_by_rating(self, movies: list[Node]) -> list[Node]:
+        """Order movies like `ORDER BY DESC(?rating)` would: by their highest review score, unrated movies last."""
+        ratings = {movie: max(map(str, self._sparql_graph.objects(movie, WDT.P444)), default=None) for movie in movies}
+        rated = sorted((movie for movie in movies if ratings[movie] is not None), key=ratings.get, reverse=True)
+        return rated + [movie for movie in movies if ratings[movie] is None]
+
+    @staticmethod
+    def _posting(table: _MovieTable, key: int) -> np.ndarray:
+        position = int(np.searchsorted(table.posting_keys, key))
+        if position == len(table.posting_keys) or table.posting_keys[position] != key:
+            return table.postings[:0]
+        return table.postings[table.posting_offsets[position]:table.posting_offsets[position + 1]]
+
+    def _keys(self, table: _MovieTable, movie: Node) -> np.ndarray:
+        """Get the sorted (property, value) keys of a movie, looking it up in the graph if it is not materialized."""
+        row = table.movie_rows.get(movie)
+        if row is not None:
+            return table.pairs[table.offsets[row]:table.offsets[row + 1]]
+        return self._encode(movie, table.intern)
+
+    @staticmethod
+    def _decode(table: _MovieTable, keys: np.ndarray, properties: set[Node] | None = None) -> dict[Node, set[Node]]:
+        attributes = {}
+        for key in keys.tolist():
+            property_ = table.terms[key >> 32]
+            if properties is None or property_ in properties:
+                attributes.setdefault(property_, set()).add(table.terms[key & 0xFFFFFFFF])
+        return attributes
+
+    def attributes(self, movie: Node, properties: set[Node] | None = None) -> dict[Node, set[Node]]:
+        """Get all values of every property of a movie, optionally restricted to some properties."""
+        table = self._table
+        return self._decode(table, self._keys(table, movie), properties)
+
+    def common_attributes(self, movies: list[Node], properties: set[Node] | None = None) -> dict[Node, set[Node]]:
+        """Get the (property, value) pairs shared by all given movies, grouped by property."""
+        if not movies:
+            return {}
+        table = self._table
+        common = self._keys(table, movies[0])
+        for movie in movies[1:]:
+            common = np.intersect1d(common, self._keys(table, movie), assume_unique=True)
+        return self._decode(table, common, properties)
+
+    def movies_with_attributes(self, attributes: dict[Node, set[Node]]):
+        """
+        Yield the materialized movies having at least one of the given values of every property.
+
+        Movies matching more of the values come first, equally good matches are ordered best rated first.
+        """
+        table = self._table
+        property_rows, matched_rows = [], []
+        for property_, values in attributes.items():
+            property_id = table.term_ids.get(property_)
+            value_ids = [table.term_ids.get(value) for value in values]
+            postings = [self._posting(table, property_id << 32 | value_id) for value_id in value_ids
+                        if property_id is not None and value_id is not None]
+            rows = np.concatenate(postings) if postings else table.postings[:0]
+            if not len(rows):
+                return
+            property_rows.append(np.unique(rows))
+            matched_rows.append(rows)
+        if not property_rows:
+            return
+
+        # intersect the shortest row lists first, the result stays sorted by rating
+        property_rows.sort(key=len)
+        candidates = property_rows[0]
+        for rows in property_rows[1:]:
+            if not len(candidates):
+                return
+            candidates = np.intersect1d(candidates, rows, assume_unique=True)
+
+        matched = np.concatenate(matched_rows)
+        candidates, counts = np.unique(matched[np.isin(matched, candidates)], return_counts=True)
+        for row in candidates[np.lexsort((candidates, -counts))].tolist():
+            yield table.movies[row]
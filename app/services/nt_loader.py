@@ -0,0 +1,117 @@
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app.services.graph_snapshot import GraphSnapshot, TermDictionary, key_to_term, term_to_key
+
+_TERM = r'(<[^>]*>|_:\S+|"(?:[^"\\]|\\.)*"(?:@[A-Za-z0-9-]+|\^\^<[^>]*>)?)'
+_TRIPLE = re.compile(rf'^\s*{_TERM}\s+{_TERM}\s+{_TERM}\s*\.\s*(?:#.*)?$')
+
+
+class NTriplesSyntaxError(ValueError):
+    """A line the parallel parser cannot read, at a byte offset and, once resolved, a line number of the file."""
+
+    def __init__(self, offset: int, line: str, line_number: int | None = None):
+        super().__init__(offset, line, line_number)
+        self.offset = offset
+        self.line = line
+        self.line_number = line_number
+
+    def __str__(self) -> str:
+        where = f"line {self.line_number}" if self.line_number else f"byte {self.offset}"
+        return f"Invalid N-Triples {where}: {self.line[:200]}"
+
+
+def _canonical_key(token: str) -> str:
+    """Map an N-Triples token to the dictionary key rdflib would produce for the same term."""
+    # Escapes and typed literals are normalized by rdflib, everything else is already in canonical form
+    if "\\" in token or "^^" in token:
+        return term_to_key(key_to_term(token))
+    return token
+
+
+def _read_chunk(path: str, start: int, end: int) -> tuple[int, bytes]:
+    """Read all lines starting in the byte range [start, end) of a file, with the offset of the first one."""
+    with open(path, "rb") as file:
+        if start > 0:
+            file.seek(start - 1)
+            if file.read(1) != b"\n":
+                file.readline()  # the partial first line belongs to the previous chunk
+        begin = file.tell()
+        if begin >= end:
+            return begin, b""
+        data = file.read(end - begin)
+        if data and not data.endswith(b"\n"):
+            data += file.readline()
+        return begin, data
+
+
+def _parse_chunk(args: tuple[str, int, int]) -> tuple[list[str], np.ndarray]:
+    """Parse a byte range of an N-Triples file into chunk-local term keys and an (N, 3) array of local ids."""
+    path, start, end = args
+    ids = {}
+    encoded = []
+    begin, data = _read_chunk(path, start, end)
+    lines = data.decode("utf-8").split("\n")
+    for number, line in enumerate(lines):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        match = _TRIPLE.match(line)
+        if match is None:
+            offset = begin + (len("\n".join(lines[:number]).encode("utf-8")) + 1 if number else 0)
+            raise NTriplesSyntaxError(offset, line)
+        for token in match.groups():
+            key = _canonical_key(token)
+            encoded.append(ids.setdefault(key, len(ids)))
+    return list(ids), np.asarray(encoded, dtype=np.int32).reshape(-1, 3)
+
+
+def _line_number(path: str, offset: int, block_size: int = 1 << 24) -> int:
+    """Get the 1-based number of the line starting at a byte offset of a file."""
+    newlines = 0
+    with open(path, "rb") as file:
+        while offset > 0:
+            block = file.read(min(block_size, offset))
+            if not block:
+                break
+            newlines += block.count(b"\n")
+            offset -= len(block)
+    return newlines + 1
+
+
+def _byte_ranges(path: str, chunks: int) -> list[tuple[int, int]]:
+    size = os.path.getsize(path)
+    bounds = [size * i // chunks for i in range(chunks + 1)]
+    return [(bounds[i], bounds[i + 1]) for i in range(chunks) if bounds[i] < bounds[i + 1]]
+
+
+def parse_nt_parallel(path: str, workers: int | None = None, chunks_per_worker: int = 4) -> GraphSnapshot:
+    """
+    Parse an N-Triples file with a process pool into a dictionary-encoded graph.
+
+    The file is split into byte ranges aligned to line starts, every range is parsed into a block of chunk-local
+    ids and the blocks are remapped onto one merged term dictionary at the end.
+    """
+    workers = workers or os.cpu_count() or 1
+    tasks = [(path, start, end) for start, end in _byte_ranges(path, workers * chunks_per_worker)]
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            blocks = list(executor.map(_parse_chunk, tasks))
+    except NTriplesSyntaxError as e:
+        raise NTriplesSyntaxError(e.offset, e.line, _line_number(path, e.offset)) from None
+
+    keys = sorted({key for block_keys, _ in blocks for key in block_keys})
+    ids = {key: idx for idx, key in enumerate(keys)}
+    remapped = []
+    for block_keys, block in blocks:
+        local_to_global = np.fromiter((ids[key] for key in block_keys), dtype=np.int32, count=len(block_keys))
+        remapped.append(local_to_global[block])
+
+    triples = np.concatenate(remapped) if remapped else np.empty((0, 3), dtype=np.int32)
+    triples = np.unique(triples, axis=0)  # a graph is a set of triples
+    return GraphSnapshot(TermDictionary.from_strings(keys), triples)
@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import OrderedDict
+
+from rdflib.plugins.sparql import prepareQuery
+from rdflib.plugins.sparql.sparql import Query
+
+
+class PreparedQueryCache:
+    """LRU cache of SPARQL query templates, each parsed and translated to algebra only once."""
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._queries: OrderedDict[str, Query] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, template: str) -> Query:
+        """Get the prepared query for a template, preparing it on a miss."""
+        with self._lock:
+            prepared = self._queries.get(template)
+            if prepared is not None:
+                self.hits += 1
+                self._queries.move_to_end(template)
+                return prepared
+            self.misses += 1
+
+        prepared = prepareQuery(template)
+        with self._lock:
+            self._queries[template] = prepared
+            if len(self._queries) > self.max_size:
+                self._queries.popitem(last=False)
+        return prepared
+
+    def clear(self):
+        with self._lock:
+            self._queries.clear()
+
+    def info(self) -> dict[str, int]:
+        """Get the hit/miss counters and the current size of the cache."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._queries), "max_size": self.max_size}
+
+
+class QueryResultCache:
+    """
+    LRU cache of materialized query results, bounded by entry count and estimated size in bytes.
+
+    Entries expire after `ttl` seconds and the whole cache has to be invalidated whenever the graph is (re)loaded.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 32 * 1024 * 1024, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.size_bytes = 0
+        self._entries: OrderedDict[tuple, tuple[float, int, list]] = OrderedDict()  # key -> (expiry, size, rows)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(query: str, init_bindings: dict | None = None) -> tuple:
+        """Key a query by its whitespace-normalized text and its bindings."""
+        bindings = tuple(sorted((str(name), value.n3()) for name, value in (init_bindings or {}).items()))
+        return " ".join(query.split()), bindings
+
+    @staticmethod
+    def _estimate_size(rows: list) -> int:
+        return 64 + sum(56 + sum(64 + len(item) if item is not None else 16 for item in row) for row in rows)
+
+    def get(self, key: tuple) -> list | None:
+        """Get the cached rows for a key, None on a miss or if the entry expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._pop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def put(self, key: tuple, rows: list):
+        size = self._estimate_size(rows)
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, rows)
+            self.size_bytes += size
+            while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def _pop(self, key: tuple):
+        _, size, _ = self._entries.pop(key)
+        self.size_bytes -= size
+
+    def invalidate(self):
+        """Drop all cached results."""
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def info(self) -> dict[str, int]:
+        """Get the hit/miss counters and the current size of the cache."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "bytes": self.size_bytes,
+                "max_size": self.max_entries, "max_bytes": self.max_bytes}
@@ -0,0 +1,105 @@
+import logging
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+# Template recorded for all queries once the number of distinct templates reached the limit
+OTHER_TEMPLATE = "other"
+
+_ENTITY = re.compile(r'\bwd:Q\d+\b|<http://www\.wikidata\.org/entity/Q\d+>')
+_LITERAL = re.compile(r'"(?:[^"\\]|\\.)*"')
+_NUMBER = re.compile(r'\b(LIMIT|OFFSET)\s+\d+', re.IGNORECASE)
+
+
+def query_template(query: str) -> str:
+    """Reduce a query to its template by normalizing whitespace and masking entities, literals and limits."""
+    template = " ".join(query.split())
+    template = _ENTITY.sub("wd:Q_", template)
+    template = _LITERAL.sub('"?"', template)
+    return _NUMBER.sub(lambda match: f"{match.group(1)} ?", template)
+
+
+class TemplateStats:
+    def __init__(self, buckets: list[int] | None = None, count: int = 0, seconds: float = 0.0, rows: int = 0,
+                 cache_hits: int = 0):
+        self.buckets = buckets or [0] * len(LATENCY_BUCKETS)  # cumulative counts per latency bucket
+        self.count = count
+        self.seconds = seconds
+        self.rows = rows
+        self.cache_hits = cache_hits
+
+
+class QueryMetrics:
+    """Per-template latency histograms, row counts and cache hits of SPARQL queries, with a slow query log."""
+
+    def __init__(self, slow_query_threshold: float = 0.5, max_templates: int = 256):
+        self.slow_query_threshold = slow_query_threshold  # seconds
+        self.max_templates = max_templates  # bounds the memory and the label cardinality of free-form queries
+        self.slow_queries = 0
+        self._templates: dict[str, TemplateStats] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, query: str, seconds: float, rows: int, cache_hit: bool):
+        """Record one evaluated query."""
+        template = query_template(query)
+        with self._lock:
+            stats = self._templates.get(template)
+            if stats is None:
+                if len(self._templates) >= self.max_templates:
+                    template = OTHER_TEMPLATE
+                stats = self._templates.setdefault(template, TemplateStats())
+            stats.count += 1
+            stats.seconds += seconds
+            stats.rows += rows
+            stats.cache_hits += cache_hit
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    stats.buckets[i] += 1
+            if seconds >= self.slow_query_threshold:
+                self.slow_queries += 1
+
+        if seconds >= self.slow_query_threshold:
+            logger.warning(f"Slow SPARQL query ({seconds * 1000:.1f} ms, {rows} rows): {' '.join(query.split())}")
+
+    def render_prometheus(self, caches: dict[str, dict[str, int]] | None = None) -> str:
+        """Render all metrics, plus the counters of the given caches, in the Prometheus text exposition format."""
+        with self._lock:
+            templates = {template: TemplateStats(list(stats.buckets), stats.count, stats.seconds, stats.rows,
+                                                 stats.cache_hits) for template, stats in self._templates.items()}
+            slow_queries = self.slow_queries
+
+        lines = ["# HELP sparql_query_duration_seconds Latency of SPARQL queries per template.",
+                 "# TYPE sparql_query_duration_seconds histogram"]
+        for template, stats in templates.items():
+            label = f'template="{_escape(template)}"'
+            for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                lines.append(f'sparql_query_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'sparql_query_duration_seconds_bucket{{{label},le="+Inf"}} {stats.count}')
+            lines.append(f'sparql_query_duration_seconds_sum{{{label}}} {stats.seconds}')
+            lines.append(f'sparql_query_duration_seconds_count{{{label}}} {stats.count}')
+
+        lines += ["# HELP sparql_query_rows_total Result rows returned per template.",
+                  "# TYPE sparql_query_rows_total counter"]
+        lines += [f'sparql_query_rows_total{{template="{_escape(t)}"}} {s.rows}' for t, s in templates.items()]
+
+        lines += ["# HELP sparql_query_cache_hits_total Queries answered from the result cache per template.",
+                  "# TYPE sparql_query_cache_hits_total counter"]
+        lines += [f'sparql_query_cache_hits_total{{template="{_escape(t)}"}} {s.cache_hits}' for t, s in templates.items()]
+
+        lines += ["# HELP sparql_slow_queries_total Queries slower than the slow query threshold.",
+                  "# TYPE sparql_slow_queries_total counter",
+                  f"sparql_slow_queries_total {slow_queries}"]
+
+        for cache, info in (caches or {}).items():
+            for name, value in info.items():
+                metric = f"sparql_{cache}_cache_{name}" + ("_total" if name in ("hits", "misses") else "")
+                lines += [f"# TYPE {metric} {'counter' if name in ('hits', 'misses') else 'gauge'}", f"{metric} {value}"]
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -1,6 +1,7 @@
 import random
 
 import rdflib
+from rdflib import URIRef
 
 from app.config.app import settings
 from app.services.answering_service import AnsweringService
@@ -10,7 +11,10 @@ from app.services.extractors.movie_extraction import MovieExtractor
 from app.services.llm_service import LlmService
 from app.services.question_classifier import QuestionCategory
 from app.services.image_finder import ImageFinder
-from app.services.sparql_graph import SPARQLGraph
+from app.services.movie_index import MovieAttributeIndex
+from app.services.sparql_graph import SPARQLGraph, WD, WDT
+
+DESIGNATED_ATTRIBUTES = {WDT.P136, WDT.P57, WDT.P179}
 
 
 class RecommendationService(AnsweringService):
@@ -21,6 +25,8 @@ class RecommendationService(AnsweringService):
         self._movie_extractor = MovieExtractor(spacy_extractor=spacy_extractor)
         self._image_finder = image_finder
         self._amount_recommendations = amount_recommendations
+        self._attribute_index = MovieAttributeIndex(sparql_graph)
+        self._sparql_graph.add_load_hook(self._attribute_index.build)
 
     def get_response(self, room_id: str, message: str) -> str:
         # 1) extract entities, then remove the entity from the message
@@ -65,7 +71,7 @@ class RecommendationService(AnsweringService):
         movie_names = [self._sparql_graph.get_lbl_for_ent(movie_id) for movie_id in movie_ids]
         return f'There is no movie worthy of {", ".join(movie_names)} to be recommended.'
 
-    def _attribute_based_recommendation(self, movie_ids, designated_attributes: bool) -> tuple[list | None, dict[str: str] | None]:
+    def _attribute_based_recommendation(self, movie_ids, designated_attributes: bool) -> tuple[list | None, dict[URIRef, set[URIRef]] | None]:
         if len(movie_ids) < 2:
             return None, None
 
@@ -83,39 +89,20 @@ class RecommendationService(AnsweringService):
 
         return response, common_attributes
 
-    def _get_common_attributes(self, movie_ids, designated_attributes: bool) -> dict:
-        movie_attributes = []
-        for movie_id in movie_ids:
-            """Queries the knowledge graph to get all attributes and corresponding values for a specific movie."""
-            query = f"""PREFIX wd: <http://www.wikidata.org/entity/>
-                        PREFIX wdt: <http://www.wikidata.org/prop/direct/>
-                        SELECT ?property ?value
-                        WHERE {{
-                            {"VALUES ?property { wdt:P136 wdt:P57 wdt:P179 }" if designated_attributes else ""}
-                            wd:{movie_id} ?property ?value .
-                        }}"""
-
-            try:
-                results = self._sparql_graph.execute_query_plain_answer(query)
-                attributes = {}
-                for result in results:
-                    property_, value = result
-                    if property_ and value:
-                        attributes[property_] = value
-            except Exception as e:
-                print(f"Error querying the graph for recommendations: {e}")
-                return {}
-
-            movie_attributes.append(attributes)
-
-        # Start with the attributes and values of the first movie
-        common_attributes = movie_attributes[0]
-
-        # Iterate over the remaining movies
-        for attributes in movie_attributes[1:]:
-            # Keep only attributes that exist in the current movie and have the same value
-            common_attributes = {attr: value for attr, value in common_attributes.items() if
-                                 attr in attributes and attributes[attr] == value and "http" in value}
+    def _get_common_attributes(self, movie_ids, designated_attributes: bool) -> dict[URIRef, set[URIRef]]:
+        """Intersects the materialized attributes of the movies, keeping only attributes with entity values."""
+        properties = DESIGNATED_ATTRIBUTES if designated_attributes else None
+        try:
+            shared = self._attribute_index.common_attributes([WD[movie_id] for movie_id in movie_ids], properties)
+        except Exception as e:
+            print(f"Error querying the graph for recommendations: {e}")
+            return {}
+
+        common_attributes = {}
+        for property_, values in shared.items():
+            values = {value for value in values if isinstance(value, URIRef)}
+            if values:
+                common_attributes[property_] = values
 
         if len(common_attributes) < 2:
             return {}
@@ -123,70 +110,37 @@ class RecommendationService(AnsweringService):
         return common_attributes
 
     def _get_movie_with_attributes(self, movie_ids, common_attributes) -> list:
-        # Construct SPARQL filters with proper handling for IRIs and literals
-        filters = "\n".join(f"?movie <{attr}> <{value}> ." for attr, value in common_attributes.items())
-        query = f"""PREFIX wd: <http://www.wikidata.org/entity/>
-                    PREFIX wdt: <http://www.wikidata.org/prop/direct/>
-                    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-                    SELECT ?movieLabel
-                    WHERE {{
-                        {filters}
-                        FILTER (?movie NOT IN ({", ".join(["wd:" + item for item in movie_ids])}))
-                        BIND(IF(ISLITERAL(?movie), ?movie, ?movieLabel) AS ?movieLabel)
-                        OPTIONAL {{
-                            ?movie rdfs:label ?movieLabel .
-                            FILTER(LANG(?movieLabel) = "en")
-                        }}
-                        OPTIONAL {{
-                            ?movie wdt:P444 ?rating .
-                        }}
-                    }}
-                    ORDER BY DESC(?rating)
-                    LIMIT {self._amount_recommendations}"""
-
-        response = self._sparql_graph.execute_query(query)
-        response = [item for item in response.split("\n") if item]
-        return response
-
-    def _genre_based_recommendation(self, movie_ids) -> tuple[list[str] | None, dict[str, str] | None]:
-        """Queries the knowledge graph to get genre for a specific movie."""
-        query = f"""PREFIX wd: <http://www.wikidata.org/entity/>
-                    PREFIX wdt: <http://www.wikidata.org/prop/direct/>
-                    SELECT ?value
-                    WHERE {{
-                        wd:{movie_ids[0]} wdt:P136 ?value .
-                    }}
-                    LIMIT 1"""
-        genre = self._sparql_graph.execute_query(query).split("\n")[0]
-
-        if genre == "":
+        """Reads the movies sharing a value of every common attribute from the inverted index, best matches first."""
+        try:
+            return self._top_labels(self._attribute_index.movies_with_attributes(common_attributes), movie_ids)
+        except Exception as e:
+            print(f"Error querying the graph for recommendations: {e}")
+            return []
+
+    def _genre_based_recommendation(self, movie_ids) -> tuple[list[str] | None, dict[URIRef, set[URIRef]] | None]:
+        """Looks up the genre of a specific movie and recommends the best rated movies of that genre."""
+        genres = self._sparql_graph.objects(WD[movie_ids[0]], WDT.P136)
+        if not genres:
             return None, None
 
-        query = f"""PREFIX wd: <http://www.wikidata.org/entity/>
-                    PREFIX wdt: <http://www.wikidata.org/prop/direct/>
-                    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-                    SELECT ?movieLabel
-                    WHERE {{
-                        ?movie wdt:P136 wd:{genre.split("/")[-1]} .
-                        FILTER (?movie NOT IN ({", ".join(["wd:" + item for item in movie_ids])}))
-                        BIND(IF(ISLITERAL(?movie), ?movie, ?movieLabel) AS ?movieLabel)
-                        OPTIONAL {{
-                            ?movie rdfs:label ?movieLabel .
-                            FILTER(LANG(?movieLabel) = "en")
-                        }}
-                        OPTIONAL {{
-                            ?movie wdt:P444 ?rating .
-                        }}
-                    }}
-                    ORDER BY DESC(?rating)
-                    LIMIT {self._amount_recommendations}"""
-
-        movie = self._sparql_graph.execute_query(query)
-        movie = [item for item in movie.split("\n") if item]
-
-        return movie, {"http://www.wikidata.org/prop/direct/P136": genre}
-
-    def _make_human_answer(self, message: list, reasoning: dict[str: str] | None = None,
+        reasoning = {WDT.P136: {genres[0]}}
+        return self._get_movie_with_attributes(movie_ids, reasoning), reasoning
+
+    def _top_labels(self, movies, movie_ids: list[str]) -> list[str]:
+        """Takes the English labels of the first movies which are not among the given ones."""
+        excluded = {WD[movie_id] for movie_id in movie_ids}
+        labels = []
+        for movie in movies:
+            if movie in excluded:
+                continue
+            label = self._sparql_graph.label(movie)
+            if label:
+                labels.append(label)
+            if len(labels) == self._amount_recommendations:
+                break
+        return labels
+
+    def _make_human_answer(self, message: list, reasoning: dict[URIRef, set[URIRef]] | None = None,
                            image: str | None = None) -> str:
         if len(message) > 1:
             message_txt = ", ".join(message[:-1]) + " and " + message[-1]
@@ -212,7 +166,10 @@ class RecommendationService(AnsweringService):
         #         print(f"Error in LLM: {e}")
 
         if reasoning:
-            list_of_attributes = '\n - '.join(f'{self._sparql_graph.get_lbl_for_ent(str(key))}: {self._sparql_graph.get_lbl_for_ent(str(value))}' for key, value in reasoning.items())
+            list_of_attributes = '\n - '.join(
+                f'{self._sparql_graph.get_lbl_for_ent(str(key))}: '
+                f'{", ".join(self._sparql_graph.get_lbl_for_ent(str(value)) for value in sorted(values))}'
+                for key, values in reasoning.items())
             answer = (f"{answer}\n\nYou wonder why? They share the following attributes:\n"
                       f" - {list_of_attributes}")
 
@@ -1,10 +1,32 @@
+import hashlib
 import json
-from rdflib import Graph
+import logging
+import threading
+import time
+from rdflib import Graph, Literal, Namespace, URIRef
+from rdflib.namespace import RDFS
+from rdflib.term import Node
 from datetime import datetime
+from itertools import islice
 import os
 
-from app.config.enums import Environment
+import numpy as np
+
+from app.config.enums import Environment, GraphBackend
 from app.config.app import settings
+from app.services.graph_snapshot import GraphSnapshot, file_checksum, language_matches, load_or_build, term_to_key
+from app.services.nt_loader import NTriplesSyntaxError, parse_nt_parallel
+from app.services.query_cache import PreparedQueryCache, QueryResultCache
+from app.services.query_metrics import QueryMetrics
+from app.services.triple_store import IndexedTripleStore
+
+logger = logging.getLogger(__name__)
+
+WD = Namespace('http://www.wikidata.org/entity/')
+WDT = Namespace('http://www.wikidata.org/prop/direct/')
+
+# Predicates queried by the services in addition to the relations which can be asked about
+PROJECTED_PREDICATES = {RDFS.label, WDT.P31, WDT.P345, WDT.P136, WDT.P57, WDT.P179, WDT.P444}
 
 
 class SPARQLGraph:
@@ -14,6 +36,14 @@ class SPARQLGraph:
         self.lbl2ent = {}
         self.rel2lbl = {}
         self.lbl2rel = {}
+        self.prepared_queries = PreparedQueryCache(settings.prepared_query_cache_size)
+        self.query_results = QueryResultCache(settings.query_result_cache_size, settings.query_result_cache_bytes,
+                                              settings.query_result_cache_ttl)
+        self.metrics = QueryMetrics(settings.slow_query_threshold_ms / 1000, settings.query_metrics_max_templates)
+        self._load_lock = threading.RLock()
+        self._ready = threading.Event()
+        self._background_load = False  # set when a loader thread owns the load
+        self._load_hooks = []
 
         if env == Environment.DEV:
             self.rdf_file = os.sep.join((settings.utils_path, "useful_dataset", "graph_test.nt"))
@@ -21,6 +51,7 @@ class SPARQLGraph:
         else:
             self.rdf_file = os.sep.join((settings.utils_path, "too_large_dataset", "ddis-movie-graph.nt"))
             self.metadata_path = os.sep.join((settings.utils_path, "useful_dataset", "graph"))
+        self.snapshot_path = self.rdf_file + ".snapshot"
 
         # if RDF file does not exist, raise an error
         if not os.path.exists(self.rdf_file):
@@ -31,19 +62,101 @@ class SPARQLGraph:
 
         # Load graph if not lazy loading
         if not lazy_load:
-            self._load_graph()
+            self.ensure_loaded()
 
     def _load_graph(self):
         """Load RDF graph on initialization."""
         graph = Graph()
         start = datetime.now()
-        print("Initializing SPARQLGraph")
+        print(f"Initializing SPARQLGraph with {settings.graph_backend.value} backend")
+        if settings.shared_store and (settings.graph_backend != GraphBackend.INDEXED or not settings.use_graph_snapshot):
+            logger.warning("shared_store needs the indexed backend with use_graph_snapshot, "
+                           "every worker process loads its own copy of the graph")
         try:
-            graph.parse(self.rdf_file, format='turtle')
+            if settings.graph_backend == GraphBackend.INDEXED:
+                graph = Graph(store=self._load_indexed_store())
+            elif settings.use_graph_snapshot:
+                graph = self._load_snapshot(self._snapshot_key()).to_graph()
+            elif not settings.full_graph:
+                # the projection works on the dictionary-encoded graph, so it is parsed into one even without a snapshot
+                graph = self._load_snapshot(None).to_graph()
+            else:
+                graph.parse(self.rdf_file, format='turtle')
             print(f"Graph loaded with {len(graph)} triples after {datetime.now() - start}")
         except Exception as e:
             print(f"Failed to load RDF data: {e}")
         self.graph = graph
+        self.query_results.invalidate()
+
+        # the data derived by the hooks is part of the load, the graph is only reported ready once it is built
+        for hook in self._load_hooks:
+            self._run_load_hook(hook)
+        self._ready.set()
+
+    @staticmethod
+    def _run_load_hook(hook):
+        try:
+            hook()
+        except Exception as e:
+            print(f"Graph load hook {hook} failed: {e}")
+
+    def _load_indexed_store(self) -> IndexedTripleStore:
+        """Build the indexed store, or attach to the indexes another process already wrote in shared store mode."""
+        if not settings.use_graph_snapshot:
+            return IndexedTripleStore(self._load_snapshot(None))
+
+        checksum = self._snapshot_key()
+        snapshot = self._load_snapshot(checksum)
+        if not settings.shared_store:
+            return IndexedTripleStore(snapshot)
+        # the indexes are written next to the snapshot, the other worker processes memory-map them
+        return load_or_build(os.path.join(self.snapshot_path, "indexes"),
+                             lambda: IndexedTripleStore.load(self.snapshot_path, snapshot, checksum),
+                             lambda: IndexedTripleStore(snapshot),
+                             lambda store: store.save(self.snapshot_path, checksum))
+
+    def _load_snapshot(self, checksum: str | None) -> GraphSnapshot:
+        """Get the dictionary-encoded graph, from the binary snapshot if it matches the RDF file checksum."""
+        if not checksum:
+            return self._parse_snapshot()
+        return load_or_build(self.snapshot_path, lambda: GraphSnapshot.load(self.snapshot_path, checksum),
+                             self._parse_snapshot, lambda snapshot: snapshot.save(self.snapshot_path, checksum))
+
+    def _parse_snapshot(self) -> GraphSnapshot:
+        """Parse the RDF file into a dictionary-encoded graph, projected unless the full graph is configured."""
+        snapshot = None
+        if settings.graph_ingestion_workers > 1 and self.rdf_file.endswith(".nt"):
+            try:
+                snapshot = parse_nt_parallel(self.rdf_file, workers=settings.graph_ingestion_workers)
+            except NTriplesSyntaxError as e:
+                # the parallel parser only reads plain N-Triples, rdflib also understands the rest of Turtle
+                print(f"Parallel parsing failed on line {e.line_number} of {self.rdf_file}: {e.line[:200]}, "
+                      f"falling back to rdflib")
+        if snapshot is None:
+            graph = Graph()
+            graph.parse(self.rdf_file, format='turtle')
+            snapshot = GraphSnapshot.from_graph(graph)
+
+        if not settings.full_graph:
+            full_triples, full_terms = len(snapshot), len(snapshot.terms)
+            snapshot = snapshot.project({term_to_key(predicate) for predicate in self._projection_predicates()})
+            print(f"Projected graph to {len(snapshot)} of {full_triples} triples and {len(snapshot.terms)} of "
+                  f"{full_terms} terms")
+        return snapshot
+
+    def _projection_predicates(self) -> set[URIRef]:
+        """Get all predicates the bot queries: the askable relations plus the ones used by the services."""
+        with open(os.path.join(self.metadata_path, 'unique_relationships.json'), 'r') as file:
+            relations = json.load(file)
+        return PROJECTED_PREDICATES | {URIRef(self.lbl2rel[label]) for label in relations if label in self.lbl2rel}
+
+    def _snapshot_key(self) -> str:
+        """Identify the snapshot by the RDF file checksum and the projection it was built with."""
+        checksum = file_checksum(self.rdf_file)
+        if settings.full_graph:
+            return checksum
+        predicates = sorted(term_to_key(predicate) for predicate in self._projection_predicates())
+        return f"{checksum}-{hashlib.sha256(' '.join(predicates).encode('utf-8')).hexdigest()[:16]}"
 
     def _load_metadata(self):
         """Load metadata from JSON files."""
@@ -72,39 +185,191 @@ class SPARQLGraph:
         except json.JSONDecodeError as e:
             print(f"Error decoding JSON metadata file: {e}")
 
-    def execute_query_plain_answer(self, query: str):
-        """Run a SPARQL query on the loaded graph."""
-        try:
-            # Lazy-load the graph if it wasn't loaded initially
-            if not self.graph:
+    def ensure_loaded(self):
+        """Lazy-load the graph if it wasn't loaded initially, blocking until it is available."""
+        if self._ready.is_set():
+            return
+        with self._load_lock:
+            # load hooks query the graph on the loading thread, which holds the lock and has already set the graph
+            if not self._ready.is_set() and self.graph is None:
                 self._load_graph()
 
-            return self.graph.query(query)
-        except Exception as e:
-            return str(e)
+    def is_ready(self) -> bool:
+        """Check whether the graph is loaded and can be queried without blocking."""
+        return self._ready.is_set()
 
-    def execute_query(self, query: str) -> str:
-        """Run a SPARQL query on the loaded graph."""
+    def load_in_background(self):
+        """Leave the load to a loader thread, requests are answered without the graph until it is ready."""
+        self._background_load = True
+
+    def is_loading_in_background(self) -> bool:
+        """Check whether the loader thread has not loaded the graph yet, querying it now would block."""
+        return self._background_load and not self._ready.is_set()
+
+    def add_load_hook(self, hook):
+        """Register a callable that derives data from the graph; it runs after every (re)load of the graph."""
+        # decided under the load lock, so a hook registered during a load runs exactly once
+        with self._load_lock:
+            self._load_hooks.append(hook)
+            if self.is_ready():
+                self._run_load_hook(hook)
+
+    def iter_query(self, query: str, init_bindings: dict[str, Node] | None = None, limit: int | None = None):
+        """
+        Lazily yield the result rows of a SPARQL query as tuples of RDF terms, at most `limit` rows.
+
+        The query template is parsed only on its first use; results are cached only if the caller consumed all of them.
+        """
+        self.ensure_loaded()
+        start = time.perf_counter()
+        key = self.query_results.make_key(query, init_bindings)
+        rows = self.query_results.get(key)
+        if rows is not None:
+            yielded = 0
+            try:
+                for row in islice(rows, limit):
+                    yielded += 1
+                    yield row
+            finally:
+                self.metrics.observe(query, time.perf_counter() - start, yielded, cache_hit=True)
+            return
+
+        rows = []
         try:
-            # Lazy-load the graph if it wasn't loaded initially
-            if not self.graph:
-                self._load_graph()
+            result = self.graph.query(self.prepared_queries.get(query), initBindings=init_bindings or {})
+            for row in islice(result, limit):
+                rows.append(row)
+                yield row
+        finally:
+            self.metrics.observe(query, time.perf_counter() - start, len(rows), cache_hit=False)
 
-            result = self.graph.query(query)
-            results_list = []
-            for row in result:
-                results_list.append([str(item).encode("utf-8").decode("utf-8") for item in row])
+        if limit is None or len(rows) < limit:
+            self.query_results.put(key, rows)
 
-            # Join results into a string with newlines
-            return '\n'.join(['\t'.join(row) for row in results_list])
+    def execute_query_plain_answer(self, query: str, init_bindings: dict[str, Node] | None = None):
+        """Run a SPARQL query on the loaded graph."""
+        try:
+            return list(self.iter_query(query, init_bindings))
+        except Exception as e:
+            return str(e)
 
+    def execute_query(self, query: str, init_bindings: dict[str, Node] | None = None) -> str:
+        """Run a SPARQL query on the loaded graph and join the results into tab and newline separated text."""
+        try:
+            return '\n'.join('\t'.join(str(item) for item in row) for row in self.iter_query(query, init_bindings))
         except Exception as e:
             print(f"Error querying the graph: {e}")
             return ""
 
+    def query_cache_info(self) -> dict[str, int]:
+        """Get the hit/miss counters of the prepared query cache."""
+        return self.prepared_queries.info()
+
+    def result_cache_info(self) -> dict[str, int]:
+        """Get the hit/miss counters of the query result cache."""
+        return self.query_results.info()
+
+    def render_metrics(self) -> str:
+        """Get the query metrics and cache counters in the Prometheus text format."""
+        return self.metrics.render_prometheus({"prepared_query": self.query_cache_info(),
+                                               "result": self.result_cache_info()})
+
+    # Direct triple lookups, answered from the graph indexes without going through the SPARQL engine
+    def objects(self, subject: Node | str, predicate: Node | str) -> list[Node]:
+        """Get all objects of the triples (subject, predicate, ?o)."""
+        self.ensure_loaded()
+        return list(self.graph.objects(_as_node(subject), _as_node(predicate)))
+
+    def objects_batch(self, pairs: list[tuple[Node | str, Node | str]]) -> list[list[Node]]:
+        """Get the objects of many (subject, predicate) pairs in one pass, aligned with the input pairs."""
+        self.ensure_loaded()
+        store = self.graph.store
+        if not isinstance(store, IndexedTripleStore):
+            return [list(self.graph.objects(_as_node(s), _as_node(p))) for s, p in pairs]
+
+        ids = np.array([(store.encode_term(_as_node(s)), store.encode_term(_as_node(p))) for s, p in pairs],
+                       dtype=np.int64).reshape(-1, 2)
+        low, high = store.object_ranges(ids[:, 0], ids[:, 1])
+        # pairs with an unknown term have an id of -1 and match nothing
+        high = np.where((ids >= 0).all(axis=1), high, low)
+        objects = store.indexes["spo"][2]
+        return [[store.decode_term(o) for o in objects[start:end].tolist()]
+                for start, end in zip(low.tolist(), high.tolist())]
+
+    def subjects(self, predicate: Node | str, object_: Node | str) -> list[Node]:
+        """Get all subjects of the triples (?s, predicate, object)."""
+        self.ensure_loaded()
+        return list(self.graph.subjects(_as_node(predicate), _as_node(object_)))
+
+    def predicate_objects(self, subject: Node | str) -> list[tuple[Node, Node]]:
+        """Get all (predicate, object) pairs of the triples (subject, ?p, ?o)."""
+        self.ensure_loaded()
+        return list(self.graph.predicate_objects(_as_node(subject)))
+
+    def range_types(self, predicate: Node | str) -> set[Node]:
+        """Get the classes (wdt:P31) of all objects of a predicate."""
+        self.ensure_loaded()
+        objects = set(self.graph.objects(None, _as_node(predicate)))
+        return {type_ for object_ in objects for type_ in self.graph.objects(object_, WDT.P31)}
+
+    def instances(self, types: set[Node]) -> set[Node]:
+        """Get all subjects which are an instance (wdt:P31) of one of the given classes."""
+        self.ensure_loaded()
+        return {subject for type_ in types for subject in self.graph.subjects(WDT.P31, type_)}
+
+    def range_instances(self) -> tuple[list[str], dict[Node, np.ndarray]]:
+        """
+        Get, for every predicate, the instances of the classes (wdt:P31) of its objects.
+
+        Returns the URIs of all these instances and, per predicate, the positions of its instances in that list.
+        Predicates without typed objects are left out.
+        """
+        self.ensure_loaded()
+        store = self.graph.store
+        if not isinstance(store, IndexedTripleStore):
+            instances = {predicate: {str(subject) for subject in self.instances(self.range_types(predicate))
+                                     if isinstance(subject, URIRef)} for predicate in set(self.graph.predicates())}
+            uris = sorted(set().union(*instances.values()))
+            positions = {uri: position for position, uri in enumerate(uris)}
+            return uris, {predicate: np.array([positions[uri] for uri in subjects], dtype=np.int64)
+                          for predicate, subjects in instances.items() if subjects}
+
+        type_predicate = store.encode_term(WDT.P31)
+        if type_predicate < 0:
+            return [], {}
+        instances = store.range_instances(type_predicate)
+        term_ids = np.unique(np.concatenate(list(instances.values()))) if instances else np.empty(0, dtype=np.int32)
+        # every term is decoded once, however many predicates it is an instance for
+        keys = store.terms.decode_many(term_ids)
+        uris = [key[1:-1] if key.startswith("<") else "" for key in keys]
+        return uris, {store.decode_term(predicate_id): np.searchsorted(term_ids, subjects)
+                      for predicate_id, subjects in instances.items()}
+
+    def label(self, term: Node | str, lang: str = "en") -> str | None:
+        """Get the rdfs:label of a term in the given language, literals are their own label."""
+        term = _as_node(term)
+        if isinstance(term, Literal):
+            return str(term)
+        self.ensure_loaded()
+
+        store = self.graph.store
+        if lang == "en" and isinstance(store, IndexedTripleStore):
+            term_id = store.encode_term(term)
+            label_id = store.label_id(term_id) if term_id >= 0 else -1
+            return str(store.decode_term(label_id)) if label_id >= 0 else None
+
+        for label in self.graph.objects(term, RDFS.label):
+            if isinstance(label, Literal) and label.language and language_matches(label.language, lang):
+                return str(label)
+        return None
+
     # Metadata access methods
     def get_lbl_for_ent(self, entity_uri: str) -> str:
-        """Get label for a given entity URI."""
+        """Get label for a given entity URI, from the graph labels once the graph is loaded."""
+        if self.is_ready():
+            label = self.label(entity_uri)
+            if label:
+                return label
         return self.ent2lbl.get(entity_uri, "Unknown Label")
 
     def get_ent_for_lbl(self, label: str) -> str:
@@ -134,3 +399,7 @@ class SPARQLGraph:
     def get_uri_for_person(self, person: str) -> str:
         """Get the IMDB URI for a given person label."""
         return self.person2id.get(person, "Unknown ID")
+
+
+def _as_node(term: Node | str) -> Node:
+    return term if isinstance(term, Node) else URIRef(term)
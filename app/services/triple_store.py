@@ -0,0 +1,238 @@
+from functools import lru_cache
+
+import numpy as np
+from rdflib.namespace import RDFS
+from rdflib.store import Store
+from rdflib.term import Node
+
+from app.services.graph_snapshot import GraphSnapshot, key_to_term, language_matches, literal_language, read_arrays, \
+    read_meta, term_to_key, write_arrays
+
+
+class IndexedTripleStore(Store):
+    """
+    Read-only rdflib store over dictionary-encoded triples.
+
+    Every triple is kept as three int32 term ids in three sorted permutations (SPO, POS, OSP), so any
+    triple pattern is answered by binary searches over the permutation whose prefix is bound. The English
+    rdfs:label of every term is materialized as a column indexed by term id.
+    """
+    context_aware = False
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = False
+
+    # permutation name -> order of the (s, p, o) positions in that index
+    PERMUTATIONS = {"spo": (0, 1, 2), "pos": (1, 2, 0), "osp": (2, 0, 1)}
+    VERSION = 2
+
+    def __init__(self, snapshot: GraphSnapshot, decode_cache_size: int = 1 << 16,
+                 indexes: dict[str, np.ndarray] | None = None, labels: np.ndarray | None = None):
+        super().__init__()
+        self.terms = snapshot.terms
+        self._size = len(snapshot)
+        if indexes is None:
+            self.indexes = {name: self._build_index(snapshot.triples, order) for name, order in self.PERMUTATIONS.items()}
+        else:
+            self.indexes = {name: tuple(index) for name, index in indexes.items()}
+        self.decode_term = lru_cache(maxsize=decode_cache_size)(self._decode_term)
+        self.labels = self._build_label_column("en") if labels is None else labels
+        self._namespace = {}
+        self._prefix = {}
+
+    def save(self, directory: str, source_checksum: str):
+        """Write the permutation indexes and the label column next to the snapshot they were built from."""
+        arrays = {f"index_{name}": np.stack(index) for name, index in self.indexes.items()}
+        write_arrays(directory, {**arrays, "labels_en": self.labels},
+                     {"version": self.VERSION, "source_checksum": source_checksum, "triples": self._size}, "indexes.json")
+
+    @classmethod
+    def load(cls, directory: str, snapshot: GraphSnapshot, source_checksum: str) -> "IndexedTripleStore | None":
+        """Memory-map previously saved indexes read-only, None if they are missing or belong to another snapshot."""
+        meta = read_meta(directory, cls.VERSION, source_checksum, "indexes.json")
+        if meta is None or meta.get("triples") != len(snapshot):
+            return None
+
+        # every (3, N) index is C-contiguous, so each of its rows is a contiguous column view into the mapped file
+        arrays = read_arrays(directory, [f"index_{name}" for name in cls.PERMUTATIONS] + ["labels_en"])
+        indexes = {name: arrays[f"index_{name}"] for name in cls.PERMUTATIONS}
+        return cls(snapshot, indexes=indexes, labels=arrays["labels_en"])
+
+    @staticmethod
+    def _build_index(triples: np.ndarray, order: tuple[int, int, int]) -> tuple[np.ndarray, ...]:
+        """Sort the triples lexicographically in the given position order and store each column contiguously."""
+        columns = [np.asarray(triples[:, position]) for position in order]
+        permutation = np.lexsort(columns[::-1])
+        return tuple(np.ascontiguousarray(column[permutation]) for column in columns)
+
+    def _build_label_column(self, lang: str) -> np.ndarray:
+        """Map every term id to the id of its first rdfs:label in the given language, -1 if it has none."""
+        labels = np.full(len(self.terms), -1, dtype=np.int32)
+        label_predicate = self.encode_term(RDFS.label)
+        if label_predicate < 0:
+            return labels
+
+        _, objects, subjects = self.indexes["pos"]
+        low, high = self._range(self.indexes["pos"], (label_predicate,))
+        # objects are sorted within the predicate range, so iterating backwards leaves the first label per subject
+        for label_id, subject_id in zip(objects[low:high][::-1].tolist(), subjects[low:high][::-1].tolist()):
+            language = literal_language(self.terms.decode(label_id))
+            if language is not None and language_matches(language, lang):
+                labels[subject_id] = label_id
+        return labels
+
+    def label_id(self, term_id: int) -> int:
+        """Get the id of the English label of a term, -1 if it has none."""
+        return int(self.labels[term_id])
+
+    def _decode_term(self, term_id: int) -> Node:
+        return key_to_term(self.terms.decode(term_id))
+
+    def encode_term(self, term: Node) -> int:
+        """Get the id of a term, -1 if the term does not occur in the graph."""
+        return self.terms.lookup(term_to_key(term))
+
+    @staticmethod
+    def _range(index: tuple[np.ndarray, ...], bound: tuple[int, ...]) -> tuple[int, int]:
+        """Find the rows of a permutation index whose leading columns equal the bound ids."""
+        low, high = 0, len(index[0])
+        for column, value in zip(index, bound):
+            window = column[low:high]
+            low, high = low + int(np.searchsorted(window, value, "left")), low + int(np.searchsorted(window, value, "right"))
+            if low == high:
+                break
+        return low, high
+
+    def triple_ids(self, s: int | None, p: int | None, o: int | None):
+        """Yield the (s, p, o) id triples matching a pattern of ids, None being a wildcard."""
+        if s is not None and (p is not None or o is None):
+            name, bound = "spo", (s, p, o)
+        elif s is not None:
+            name, bound = "osp", (o, s)
+        elif p is not None:
+            name, bound = "pos", (p, o)
+        elif o is not None:
+            name, bound = "osp", (o,)
+        else:
+            name, bound = "spo", ()
+
+        # only the leading bound ids narrow down the range, trailing wildcards are dropped
+        if None in bound:
+            bound = bound[:bound.index(None)]
+        index = self.indexes[name]
+        low, high = self._range(index, bound)
+        order = self.PERMUTATIONS[name]
+        rows = zip(*(column[low:high].tolist() for column in index))
+        for row in rows:
+            triple = [0, 0, 0]
+            for position, value in zip(order, row):
+                triple[position] = value
+            yield tuple(triple)
+
+    def object_ranges(self, subjects: np.ndarray, predicates: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find the rows of the SPO index matching many (subject, predicate) id pairs at once.
+
+        Returns the arrays `low, high` aligned with the input, the objects of pair i are `indexes["spo"][2][low[i]:high[i]]`.
+        """
+        subject_column, predicate_column, _ = self.indexes["spo"]
+        subjects, predicates = np.asarray(subjects), np.asarray(predicates)
+        low = np.searchsorted(subject_column, subjects, "left")
+        high = np.searchsorted(subject_column, subjects, "right")
+        return (self._bisect(predicate_column, low, high, predicates, "left"),
+                self._bisect(predicate_column, low, high, predicates, "right"))
+
+    def range_instances(self, type_predicate: int) -> dict[int, np.ndarray]:
+        """
+        Map every predicate id to the sorted ids of all subjects sharing a class (`type_predicate`) with its objects.
+
+        Predicates without typed objects are left out, predicates whose objects have the same classes share one array.
+        """
+        predicates, objects, subjects = self.indexes["pos"]
+        low, high = self._range(self.indexes["pos"], (type_predicate,))
+        # (class, instance) pairs sorted by class, and the same pairs sorted by instance
+        classes, instances = np.asarray(objects[low:high]), np.asarray(subjects[low:high])
+        by_instance = np.argsort(instances, kind="stable")
+        typed, typed_classes = instances[by_instance], classes[by_instance]
+
+        predicates = np.asarray(predicates)
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(predicates)) + 1, [len(predicates)]))
+        result, shared = {}, {}
+        for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            range_objects = np.unique(objects[start:end])
+            range_classes = np.unique(self._gather(typed_classes, np.searchsorted(typed, range_objects, "left"),
+                                                   np.searchsorted(typed, range_objects, "right")))
+            if not len(range_classes):
+                continue
+            key = range_classes.tobytes()
+            if key not in shared:
+                shared[key] = np.unique(self._gather(instances, np.searchsorted(classes, range_classes, "left"),
+                                                     np.searchsorted(classes, range_classes, "right")))
+            result[int(predicates[start])] = shared[key]
+        return result
+
+    @staticmethod
+    def _gather(column: np.ndarray, low: np.ndarray, high: np.ndarray) -> np.ndarray:
+        """Concatenate the slices column[low[i]:high[i]] without a Python loop."""
+        counts = high - low
+        starts = np.repeat(low - (np.cumsum(counts) - counts), counts)
+        return column[starts + np.arange(int(counts.sum()))]
+
+    @staticmethod
+    def _bisect(column: np.ndarray, low: np.ndarray, high: np.ndarray, values: np.ndarray, side: str) -> np.ndarray:
+        """Binary search every value in its own sorted window column[low:high], all windows in lockstep."""
+        low, high = low.copy(), high.copy()
+        active = low < high
+        while active.any():
+            middle = (low + high) // 2
+            # windows that are already empty keep probing a valid row, their result is masked out below
+            probe = column[np.minimum(middle, len(column) - 1)]
+            go_right = probe < values if side == "left" else probe <= values
+            low = np.where(active & go_right, middle + 1, low)
+            high = np.where(active & ~go_right, middle, high)
+            active = low < high
+        return low
+
+    # rdflib Store interface
+    def triples(self, triple_pattern, context=None):
+        ids = []
+        for term in triple_pattern:
+            if term is None:
+                ids.append(None)
+                continue
+            term_id = self.encode_term(term)
+            if term_id < 0:
+                return
+            ids.append(term_id)
+
+        for s, p, o in self.triple_ids(*ids):
+            yield (self.decode_term(s), self.decode_term(p), self.decode_term(o)), iter(())
+
+    def __len__(self, context=None) -> int:
+        return self._size
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    def add(self, triple, context, quoted=False):
+        raise TypeError("IndexedTripleStore is read-only")
+
+    def remove(self, triple, context=None):
+        raise TypeError("IndexedTripleStore is read-only")
+
+    def bind(self, prefix, namespace, override=True):
+        if not override and (prefix in self._namespace or namespace in self._prefix):
+            return
+        self._prefix.pop(self._namespace.get(prefix), None)
+        self._namespace.pop(self._prefix.get(namespace), None)
+        self._namespace[prefix] = namespace
+        self._prefix[namespace] = prefix
+
+    def namespace(self, prefix):
+        return self._namespace.get(prefix)
+
+    def prefix(self, namespace):
+        return self._prefix.get(namespace)
+
+    def namespaces(self):
+        yield from self._namespace.items()
@@ -0,0 +1,101 @@
+from rdflib import Graph, Literal, RDFS
+
+from app.services.movie_index import MovieAttributeIndex
+from app.services.sparql_graph import WD, WDT
+
+MOVIES = {
+    # movie: (label, rating, genres, directors)
+    "Q1": ("First", "6", ["G1", "G2"], ["D1"]),
+    "Q2": ("Second", "5", ["G1", "G2"], ["D1"]),
+    "Q3": ("Third", "9", ["G1"], ["D1"]),
+    "Q4": ("Fourth", "7", ["G1", "G2"], ["D1"]),
+    "Q5": ("Fifth", "8", ["G2"], ["D1"]),
+    "Q6": ("Sixth", "9.5", ["G1"], ["D2"]),
+    "Q7": ("Seventh", "4", ["G3"], ["D1"]),
+}
+
+
+class FixtureGraph:
+    """The parts of SPARQLGraph used by the movie index, over a small in-memory graph."""
+
+    def __init__(self):
+        self.graph = Graph()
+        for movie, (label, rating, genres, directors) in MOVIES.items():
+            self.graph.add((WD[movie], RDFS.label, Literal(label, lang="en")))
+            self.graph.add((WD[movie], WDT.P444, Literal(rating)))
+            for genre in genres:
+                self.graph.add((WD[movie], WDT.P136, WD[genre]))
+            for director in directors:
+                self.graph.add((WD[movie], WDT.P57, WD[director]))
+        self.movie2id = {label: str(WD[movie]) for movie, (label, *_) in MOVIES.items()}
+
+    def predicate_objects(self, subject):
+        return list(self.graph.predicate_objects(subject))
+
+    def objects(self, subject, predicate):
+        return list(self.graph.objects(subject, predicate))
+
+
+def baseline_recommendation(graph: Graph, movie_ids: list[str], representative: dict) -> list[str]:
+    """The query the recommendations used before the index, with one value per common property."""
+    filters = "\n".join(f"?movie <{attr}> <{value}> ." for attr, value in representative.items())
+    query = f"""PREFIX wd: <http://www.wikidata.org/entity/>
+                PREFIX wdt: <http://www.wikidata.org/prop/direct/>
+                PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+                SELECT ?movieLabel
+                WHERE {{
+                    {filters}
+                    FILTER (?movie NOT IN ({", ".join(["wd:" + item for item in movie_ids])}))
+                    OPTIONAL {{
+                        ?movie rdfs:label ?movieLabel .
+                        FILTER(LANG(?movieLabel) = "en")
+                    }}
+                    OPTIONAL {{
+                        ?movie wdt:P444 ?rating .
+                    }}
+                }}
+                ORDER BY DESC(?rating)"""
+    return [str(label) for label, in graph.query(query)]
+
+
+def index_recommendation(index: MovieAttributeIndex, movie_ids: list[str], attributes: dict) -> list[str]:
+    excluded = {WD[movie_id] for movie_id in movie_ids}
+    return [MOVIES[movie.split("/")[-1]][0] for movie in index.movies_with_attributes(attributes)
+            if movie not in excluded]
+
+
+def build_index() -> tuple[FixtureGraph, MovieAttributeIndex]:
+    graph = FixtureGraph()
+    index = MovieAttributeIndex(graph)
+    index.build()
+    return graph, index
+
+
+def test_common_attributes_keep_every_shared_value():
+    _, index = build_index()
+    common = index.common_attributes([WD["Q1"], WD["Q2"]], {WDT.P136, WDT.P57})
+    assert common == {WDT.P136: {WD["G1"], WD["G2"]}, WDT.P57: {WD["D1"]}}
+
+
+def test_single_valued_attributes_match_the_baseline_query():
+    graph, index = build_index()
+    movie_ids = ["Q3", "Q6"]
+    common = index.common_attributes([WD[movie_id] for movie_id in movie_ids], {WDT.P136, WDT.P57})
+    assert common == {WDT.P136: {WD["G1"]}}
+
+    representative = {property_: next(iter(values)) for property_, values in common.items()}
+    assert index_recommendation(index, movie_ids, common) == baseline_recommendation(graph.graph, movie_ids,
+                                                                                     representative)
+
+
+def test_multi_valued_attributes_cover_the_baseline_query_for_any_representative_value():
+    graph, index = build_index()
+    movie_ids = ["Q1", "Q2"]
+    common = index.common_attributes([WD[movie_id] for movie_id in movie_ids], {WDT.P136, WDT.P57})
+    recommended = index_recommendation(index, movie_ids, common)
+
+    for genre in common[WDT.P136]:
+        baseline = baseline_recommendation(graph.graph, movie_ids, {WDT.P136: genre, WDT.P57: WD["D1"]})
+        assert baseline and set(baseline) <= set(recommended)
+    # the movie sharing both genres comes first, then the others by rating
+    assert recommended == ["Fourth", "Third", "Fifth"]
@@ -0,0 +1,66 @@
+"""
+Measure the recall and latency of the IVF entity index against the exact TransE nearest neighbour search.
+
+Every query is the TransE prediction head + relation of a random entity and relation. The exact top-k over all entities
+is compared with the top-k of the index for every given number of probed lists.
+
+Usage: python ./utils/benchmarks/embedding_ann.py [--queries 1000] [--k 1 10] [--probe 4 8 16 32] [--lists 0]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from sklearn.metrics import pairwise_distances
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from app.config.app import settings  # noqa: E402
+from app.services.ann_index import IVFFlatIndex  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embeddings", default=os.path.join(settings.too_large_dataset_path, "ddis-graph-embeddings"))
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--probe", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--lists", type=int, default=settings.ann_lists)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    entity_emb = np.load(os.path.join(args.embeddings, "entity_embeds.npy"))
+    relation_emb = np.load(os.path.join(args.embeddings, "relation_embeds.npy"))
+    rng = np.random.default_rng(args.seed)
+    queries = (entity_emb[rng.integers(len(entity_emb), size=args.queries)]
+               + relation_emb[rng.integers(len(relation_emb), size=args.queries)])
+    max_k = max(args.k)
+
+    start = time.perf_counter()
+    exact = []
+    for query in queries:
+        # the exact path of EmbeddingsService.calculate_embeddings
+        distances = pairwise_distances(query.reshape(1, -1), entity_emb).reshape(-1)
+        exact.append(distances.argsort()[:max_k])
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    print(f"Exact search over {len(entity_emb)} entities: {exact_ms:.3f} ms per query")
+
+    start = time.perf_counter()
+    index = IVFFlatIndex.build(entity_emb, args.lists or None)
+    print(f"Index with {len(index.centroids)} lists built in {time.perf_counter() - start:.1f}s")
+
+    for n_probe in args.probe:
+        start = time.perf_counter()
+        approximate = [index.search(query, k=max_k, n_probe=n_probe)[0] for query in queries]
+        elapsed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        recalls = []
+        for k in args.k:
+            hits = sum(len(np.intersect1d(e[:k], a[:k])) for e, a in zip(exact, approximate))
+            recalls.append(f"recall@{k} {hits / (k * len(queries)):.3f}")
+        print(f"n_probe {n_probe}: {elapsed_ms:.3f} ms per query, speedup {exact_ms / elapsed_ms:.1f}x, "
+              f"{', '.join(recalls)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Compare the storage formats of the entity embeddings: startup time, resident memory and answer agreement with float32.
+
+Every format is loaded in a fresh process, which converts the matrix first if no converted copy exists yet. The
+answers are the exact nearest entities of the TransE predictions head + relation of random entities and relations.
+
+Usage: python ./utils/benchmarks/embedding_storage.py [--queries 200] [--formats float32 float16 int8] [--mmap]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from app.config.app import settings  # noqa: E402
+from app.config.enums import EmbeddingStorage  # noqa: E402
+from app.services.embedding_matrix import EmbeddingMatrix  # noqa: E402
+from app.services.embeddings_service import EmbeddingsService  # noqa: E402
+
+
+def _rss_mb() -> float:
+    """Get the resident set size of this process in MB (Linux only)."""
+    with open("/proc/self/status", "r") as file:
+        for line in file:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def measure(embeddings_path: str, storage: EmbeddingStorage, mmap: bool, queries: int, seed: int):
+    """Load one format and print its startup time, memory and answers as JSON."""
+    settings.embeddings_storage = storage
+    start = time.perf_counter()
+    matrix: EmbeddingMatrix = EmbeddingsService._load_entity_matrix(
+        os.path.join(embeddings_path, "entity_embeds.npy"), "r" if mmap else None)
+    startup = time.perf_counter() - start
+    relation_emb = np.load(os.path.join(embeddings_path, "relation_embeds.npy"))
+
+    rng = np.random.default_rng(seed)
+    heads = rng.integers(len(matrix), size=queries)
+    relations = rng.integers(len(relation_emb), size=queries)
+    start = time.perf_counter()
+    answers = [int(matrix.distances(matrix[head] + relation_emb[relation]).argmin())
+               for head, relation in zip(heads, relations)]
+    query_ms = (time.perf_counter() - start) * 1000 / queries
+    print(json.dumps({"startup": startup, "rss": _rss_mb(), "query_ms": query_ms, "answers": answers}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embeddings", default=os.path.join(settings.too_large_dataset_path, "ddis-graph-embeddings"))
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--formats", nargs="+", default=[storage.value for storage in EmbeddingStorage])
+    parser.add_argument("--mmap", action="store_true", help="memory-map the matrices instead of reading them")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        measure(args.embeddings, EmbeddingStorage(args.child), args.mmap, args.queries, args.seed)
+        return
+
+    reference = None
+    for storage in args.formats:
+        command = [sys.executable, __file__, "--embeddings", args.embeddings, "--queries", str(args.queries),
+                   "--seed", str(args.seed), "--child", storage] + (["--mmap"] if args.mmap else [])
+        # run twice, the first run of a compact format includes its one-time conversion
+        for run in ("first", "warm"):
+            output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            reference = reference or result["answers"]
+            agreement = np.mean(np.array(result["answers"]) == np.array(reference))
+            print(f"{storage:8} ({run} start): startup {result['startup']:.2f}s, RSS {result['rss']:.0f} MB, "
+                  f"{result['query_ms']:.2f} ms per query, top-1 agreement with {args.formats[0]} {agreement:.3f}")
+
+
+if __name__ == "__main__":
+    main()
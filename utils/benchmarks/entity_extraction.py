@@ -0,0 +1,119 @@
+"""
+Profile the entity extraction of the SpacyExtractor over the questions logged by the agent.
+
+Every "Received message:" line of the given logs is run through `get_entities_with_fuzzy_matching` for every entity
+type, timing the spaCy, exact and fuzzy stages on their own. The full-candidate `partial_ratio_alignment` call which
+`get_fuzzy_matches` used to make before its per-candidate loop is timed as well, as the per-message saving of
+computing every alignment once.
+
+The names extracted from some messages where common-word names like "it" or "tell" occur verbatim next to a
+misspelled or partial name are printed as well, the fuzzy pass must still find the latter.
+
+Usage: python ./utils/benchmarks/entity_extraction.py [--logs app.PROD.*.log] [--limit 0] [--profile]
+"""
+import argparse
+import contextlib
+import cProfile
+import glob
+import io
+import os
+import pstats
+import sys
+import time
+
+import numpy as np
+from rapidfuzz import fuzz
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from app.services.extractors.main import DASHES, SpacyExtractor  # noqa: E402
+
+TYPES = ["movie", "person", "relation"]
+# messages whose verbatim common-word names must not hide the fuzzy match of the other names
+COMPARED_MESSAGES = [
+    "Recommend movies like Nightmare on Elm Street, Friday the 13th, and Halloween",
+    "Tell me who directed The Godfathr",
+    "Who directed the movie Forrest Gup? I liked it",
+]
+
+
+def read_messages(paths: list[str]) -> list[str]:
+    messages = []
+    for path in paths:
+        # the logs contain some broken non-ascii characters
+        with open(path, "r", errors="replace") as file:
+            messages += [line.split("Received message: ", 1)[1].strip() for line in file if "Received message: " in line]
+    return [message for message in messages if message]
+
+
+def timed(function, *args) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = function(*args)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def report(name: str, timings: list[float]):
+    timings = np.array(timings)
+    print(f"{name:<32} mean {timings.mean():9.2f} ms, median {np.median(timings):9.2f} ms, "
+          f"p95 {np.percentile(timings, 95):9.2f} ms")
+
+
+def main():
+    root = os.path.join(os.path.dirname(__file__), "..", "..")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logs", nargs="+", default=sorted(glob.glob(os.path.join(root, "app.PROD.*.log"))))
+    parser.add_argument("--limit", type=int, default=0, help="only use the first n messages")
+    parser.add_argument("--profile", action="store_true", help="print the functions with the most cumulative time")
+    args = parser.parse_args()
+
+    messages = read_messages(args.logs)[:args.limit or None]
+    start = time.perf_counter()
+    extractor = SpacyExtractor()
+    print(f"Extractor loaded in {time.perf_counter() - start:.1f}s, {len(messages)} messages")
+
+    stages = {name: [] for name in ["spacy", "exact", "fuzzy", "total", "removed full-candidate alignment"]}
+    profiler = cProfile.Profile()
+    # the extractor prints every intermediate result
+    with contextlib.redirect_stdout(io.StringIO()):
+        for message in messages:
+            text = extractor.preprocess_text(message)
+            folded_text = text.translate(DASHES)
+            per_message = dict.fromkeys(stages, 0.0)
+            for type in TYPES:
+                elapsed, nltk_matches = timed(extractor.get_nltk_matches, text, type)
+                per_message["spacy"] += elapsed
+                elapsed, exact_matches = timed(extractor.get_exact_matches, folded_text, type)
+                per_message["exact"] += elapsed
+                uncovered = extractor.mask_matches(folded_text, [match for match in exact_matches if len(
+                    match["original_text"]) >= extractor.short_name_length])
+                score = extractor.score_threshold_with_nltk if nltk_matches else extractor.score_threshold_without_nltk
+                per_message["fuzzy"] += timed(extractor.get_fuzzy_matches, uncovered, type, score)[0]
+                per_message["removed full-candidate alignment"] += timed(
+                    lambda: fuzz.partial_ratio_alignment(list(extractor.map[type]), folded_text + " ", processor=None,
+                                                         score_cutoff=score))[0]
+
+                profiler.enable()
+                per_message["total"] += timed(extractor.get_entities_with_fuzzy_matching, message, type)[0]
+                profiler.disable()
+            for name, elapsed in per_message.items():
+                stages[name].append(elapsed)
+
+    print("Per message, summed over the entity types:")
+    for name, timings in stages.items():
+        report(name, timings)
+    saved, total = np.sum(stages["removed full-candidate alignment"]), np.sum(stages["total"])
+    print(f"Saving of the removed alignment: {saved / len(messages):.2f} ms per message, "
+          f"{saved / (saved + total):.1%} of the previous extraction time")
+
+    print("Extracted movies:")
+    for message in COMPARED_MESSAGES:
+        with contextlib.redirect_stdout(io.StringIO()):
+            movies = extractor.get_entities_with_fuzzy_matching(message, "movie")["movie"]
+        print(f"  {message!r}: {movies}")
+
+    if args.profile:
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Compare the load time of the movie graph with rdflib's single-threaded parser against the parallel N-Triples loader.
+
+Usage: python ./utils/benchmarks/graph_loading.py [--file path/to/graph.nt] [--workers 8 16]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from rdflib import Graph  # noqa: E402
+
+from app.config.app import settings  # noqa: E402
+from app.services.nt_loader import parse_nt_parallel  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", default=os.path.join(settings.too_large_dataset_path, "ddis-movie-graph.nt"))
+    parser.add_argument("--workers", type=int, nargs="+", default=[os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    print(f"Loading {args.file} on a machine with {os.cpu_count()} cores")
+
+    start = time.perf_counter()
+    graph = Graph()
+    graph.parse(args.file, format='turtle')
+    baseline = time.perf_counter() - start
+    print(f"graph.parse: {len(graph)} triples in {baseline:.1f}s")
+    del graph
+
+    for workers in args.workers:
+        start = time.perf_counter()
+        snapshot = parse_nt_parallel(args.file, workers=workers)
+        elapsed = time.perf_counter() - start
+        print(f"parse_nt_parallel ({workers} workers): {len(snapshot)} triples in {elapsed:.1f}s, "
+              f"speedup {baseline / elapsed:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
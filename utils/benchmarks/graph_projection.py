@@ -0,0 +1,79 @@
+"""
+Compare loading the full movie graph with loading its projection onto the queried predicates and English labels.
+
+Every configuration is loaded in a fresh process and reports the triples and terms of the loaded graph, the peak
+resident memory and the wall time. The graph is loaded three times per configuration: parsed from the RDF file without
+a snapshot, building its snapshot (skipped if one exists already) and from the snapshot.
+
+Usage: python ./utils/benchmarks/graph_projection.py [--environment DEV] [--backend indexed]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from app.config.app import settings  # noqa: E402
+from app.config.enums import Environment, GraphBackend  # noqa: E402
+from app.services.sparql_graph import SPARQLGraph  # noqa: E402
+from app.services.triple_store import IndexedTripleStore  # noqa: E402
+
+
+def _peak_rss_mb() -> float:
+    """Get the peak resident set size of this process and its finished parser processes in MB (Linux reports KB)."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024
+
+
+def measure(environment: Environment, full_graph: bool, use_snapshot: bool):
+    """Load the graph once and print its size, peak memory and load time as JSON."""
+    settings.full_graph = full_graph
+    settings.use_graph_snapshot = use_snapshot
+    start = time.perf_counter()
+    graph = SPARQLGraph(environment).graph
+    seconds = time.perf_counter() - start
+    store = graph.store
+    terms = len(store.terms) if isinstance(store, IndexedTripleStore) else len(set(graph.all_nodes()) | set(graph.predicates()))
+    print(json.dumps({"triples": len(graph), "terms": terms, "rss": _peak_rss_mb(), "seconds": seconds}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--environment", default=settings.environment.value,
+                        choices=[environment.value for environment in Environment])
+    parser.add_argument("--backend", default=settings.graph_backend.value,
+                        choices=[backend.value for backend in GraphBackend])
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    settings.graph_backend = GraphBackend(args.backend)
+
+    if args.child:
+        graph, load = args.child
+        measure(Environment(args.environment), graph == "full", load != "parse")
+        return
+
+    results = {}
+    for graph in ("full", "projected"):
+        for load in ("parse", "snapshot build", "snapshot"):
+            command = [sys.executable, __file__, "--environment", args.environment, "--backend", args.backend,
+                       "--child", graph, load]
+            # the loader prints its progress, the result is the last line
+            output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+            result = results[graph, load] = json.loads(output.strip().splitlines()[-1])
+            print(f"{graph:9} ({load}): {result['triples']} triples, {result['terms']} terms, "
+                  f"peak RSS {result['rss']:.0f} MB, {result['seconds']:.2f}s")
+
+    for load in ("parse", "snapshot"):
+        full, projected = results["full", load], results["projected", load]
+        print(f"Projection ({load}): {projected['triples'] / full['triples']:.1%} of the triples, "
+              f"{projected['terms'] / full['terms']:.1%} of the terms, "
+              f"peak RSS {projected['rss'] - full['rss']:+.0f} MB, {full['seconds'] / projected['seconds']:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+"""
+Build the graph snapshot, its memory-mappable indexes and the entity embedding index once, before starting several uvicorn workers with
+SHARED_STORE=true. The workers then only attach to the files read-only instead of each building the graph.
+
+Usage: python ./utils/build_shared_store.py [dev]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.config.app import settings  # noqa: E402
+from app.config.enums import Environment  # noqa: E402
+from app.services.embeddings_service import EmbeddingsService  # noqa: E402
+from app.services.sparql_graph import SPARQLGraph  # noqa: E402
+
+if __name__ == "__main__":
+    settings.shared_store = True
+    SPARQLGraph(Environment.DEV if "dev" in sys.argv else Environment.PROD)
+    EmbeddingsService()
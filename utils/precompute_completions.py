@@ -0,0 +1,72 @@
+"""
+Precompute the top-k TransE predictions of every (movie, relation) pair which is missing from the graph.
+
+The relations are the ones in unique_relationships.json which at least `--min-support` of the movies have in the graph,
+so relations that never apply to movies are skipped. The predictions are written next to the embeddings and used by
+EmbeddingsService.calculate_embeddings instead of computing them on demand.
+
+Usage: python ./utils/precompute_completions.py [dev] [--k 10] [--min-support 0.01]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.config.enums import Environment  # noqa: E402
+from app.services.completion_table import CompletionTable  # noqa: E402
+from app.services.embeddings_service import EmbeddingsService  # noqa: E402
+from app.services.graph_snapshot import file_signature  # noqa: E402
+from app.services.sparql_graph import SPARQLGraph  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("environment", nargs="?", default="prod", choices=["dev", "prod"])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--min-support", type=float, default=0.01)
+    parser.add_argument("--batch-size", type=int, default=4096)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    sparql_graph = SPARQLGraph(Environment.DEV if args.environment == "dev" else Environment.PROD)
+    embeddings = EmbeddingsService()
+
+    movies = sorted(set(sparql_graph.movie2id.values()))
+    movie_ids = embeddings.get_ids_for_ents(movies)
+    movies, movie_ids = [movie for movie, _id in zip(movies, movie_ids) if _id >= 0], movie_ids[movie_ids >= 0]
+    with open(os.path.join(sparql_graph.metadata_path, "unique_relationships.json"), "r") as file:
+        relations = sorted({sparql_graph.lbl2rel[label] for label in json.load(file) if label in sparql_graph.lbl2rel})
+    relations = [relation for relation in relations if embeddings.get_id_for_rel(relation) >= 0]
+
+    heads, preds = [], []
+    for relation in relations:
+        objects = sparql_graph.objects_batch([(movie, relation) for movie in movies])
+        missing = movie_ids[np.array([not found for found in objects], dtype=bool)]
+        support = 1 - len(missing) / len(movies) if movies else 0
+        if support < args.min_support:
+            continue
+        print(f"{relation}: {len(missing)} of {len(movies)} movies missing (support {support:.3f})")
+        heads.append(missing)
+        preds.append(np.full(len(missing), embeddings.get_id_for_rel(relation), dtype=np.int64))
+
+    heads = np.concatenate(heads).astype(np.int64) if heads else np.empty(0, dtype=np.int64)
+    preds = np.concatenate(preds) if preds else np.empty(0, dtype=np.int64)
+    predictions = np.empty((len(heads), args.k), dtype=np.int32)
+    for batch in range(0, len(heads), args.batch_size):
+        rows = slice(batch, batch + args.batch_size)
+        predictions[rows] = embeddings.predict_ids(heads[rows], preds[rows], args.k)
+        print(f"Predicted {min(batch + args.batch_size, len(heads))} of {len(heads)} pairs")
+
+    table = CompletionTable.from_predictions(heads, preds, predictions)
+    embeddings_file = os.path.join(os.path.dirname(embeddings.completions_file()), "entity_embeds.npy")
+    table.save(embeddings.completions_file(), file_signature(embeddings_file))
+    print(f"Saved {len(table)} completions to {embeddings.completions_file()} after {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()